@@ -0,0 +1,185 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+import numpy as np
+import corpus
+import metrics
+from chatbot_server import BOT_CONFIG
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# the evaluation scripts' queries plus common phrasings per category
+FIXED_QUERIES = {
+    'restaurants': ['indian restaurant', 'italian restaurant', 'asian restaurant', 'thai restaurant',
+                    'malaysian restaurant', 'chinese restaurant', 'halal food', 'vegetarian friendly',
+                    'cafe', 'seafood near the beach'],
+    'attractions': ['museums', 'parks', 'shopping malls', 'beaches', 'historic sites',
+                    'things to do with kids', 'waterfalls', 'night markets'],
+    'hotels': ['resort', 'cheap hostel', 'hotel near the airport', 'homestay', 'luxury hotel',
+               'apartment for families'],
+}
+
+# phrasing templates for the synthetic generator, filled from the facet dictionary
+TEMPLATES = {
+    'restaurants': {'cuisine': ['{} food', '{} restaurant', 'best {} places'],
+                    'diet': ['{} restaurants', '{}'],
+                    'area': ['restaurants in {}', 'places to eat near {}']},
+    'attractions': {'type': ['{}', '{} to visit', 'best {}'],
+                    'area': ['things to do in {}']},
+    'hotels': {'type': ['{}', 'cheap {}', '{} with pool'],
+               'area': ['hotels in {}', 'stay near {}']},
+}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+# count queries drawn from the facet tags of a category, weighted towards common tags
+def synthetic_queries(category, count, seed=0):
+    settings = BOT_CONFIG[category]
+    module = settings['module']
+    facet_index = corpus.get_facets(settings['filepath'], module.FACET_FIELDS, getattr(module, 'FACET_KEYWORDS', None))
+    choices, weights = [], []
+    for field, templates in TEMPLATES[category].items():
+        for tag, entry in facet_index['tags'].get(field, {}).items():
+            for template in templates:
+                choices.append(template.format(tag))
+                weights.append(entry['count'])
+    if not choices:
+        return []
+    rng = random.Random(seed)
+    return rng.choices(choices, weights=weights, k=count)
+
+
+def load_queries(path):
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            return json.load(f)
+        return [line.strip() for line in f if line.strip()]
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    summary = {f'p{p}_ms': round(float(np.percentile(values, p)), 3) for p in PERCENTILES}
+    summary.update(mean_ms=round(float(values.mean()), 3), max_ms=round(float(values.max()), 3), count=len(samples))
+    return summary
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# total and mean milliseconds per pipeline stage from the metrics registry
+def stage_breakdown():
+    stages = {}
+    for key, (total, count) in metrics.totals(metrics.STAGE_SECONDS).items():
+        stage = dict(key)['stage']
+        entry = stages.setdefault(stage, {'total_ms': 0.0, 'count': 0})
+        entry['total_ms'] += total * 1000
+        entry['count'] += count
+    for entry in stages.values():
+        entry['mean_ms'] = round(entry['total_ms'] / entry['count'], 3)
+        entry['total_ms'] = round(entry['total_ms'], 3)
+    return stages
+
+
+# one query through either the full handler or only the retrieval core
+def run_query(mode, category, city, query):
+    settings = BOT_CONFIG[category]
+    module, sheet_name = settings['module'], settings['sheet'][city]
+    if mode == 'retrieval':
+        sheet = corpus.get_sheet(settings['filepath'], sheet_name, module.build_sheet)
+        return module.find_relevant_rows(query, sheet['df'], sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name,
+                                        grid=sheet['grid'])
+    return module.handle_request(city=city, query=query, liked=[], sheet_name=sheet_name,
+                                 filepath=settings['filepath'], name_col=settings['name_col'])
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(categories, cities, mode='request', n_queries=50, repeat=3, seed=0, query_file=None):
+    metrics.reset()
+    cold, warm, sheets = [], [], []
+
+    for category in categories:
+        if query_file:
+            queries = load_queries(query_file)
+        else:
+            queries = FIXED_QUERIES[category] + synthetic_queries(category, n_queries, seed)
+        for city in cities:
+            if city not in BOT_CONFIG[category]['sheet']:
+                continue
+            metrics.bind(category=category, city=city)
+
+            # cold: the first query builds the sheet
+            start = time.perf_counter()
+            run_query(mode, category, city, queries[0])
+            cold_seconds = time.perf_counter() - start
+            cold.append(cold_seconds)
+
+            # warm: replay the whole set against the cached sheet
+            samples = []
+            for _ in range(repeat):
+                for query in queries:
+                    start = time.perf_counter()
+                    run_query(mode, category, city, query)
+                    samples.append(time.perf_counter() - start)
+            warm.extend(samples)
+            sheets.append({'category': category, 'city': city, 'cold_ms': round(cold_seconds * 1000, 3),
+                           'warm': percentiles(samples)})
+    metrics.bind()
+
+    warm_seconds = sum(warm)
+    return {
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'processor': platform.processor(), 'commit': git_commit(),
+                        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S')},
+        'config': {'mode': mode, 'categories': categories, 'cities': cities, 'queries': n_queries,
+                   'repeat': repeat, 'seed': seed, 'query_file': query_file},
+        'cold': percentiles(cold),
+        'warm': percentiles(warm),
+        'throughput_qps': round(len(warm) / warm_seconds, 2) if warm_seconds else None,
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': stage_breakdown(),
+        'sheets': sheets
+    }
+
+
+if __name__ == "__main__":
+    cities = sorted(BOT_CONFIG['restaurants']['sheet'])
+    parser = argparse.ArgumentParser(description='Replay a query set against the search bots and report latency.')
+    parser.add_argument('--categories', nargs='+', default=list(BOT_CONFIG), choices=list(BOT_CONFIG))
+    parser.add_argument('--cities', nargs='+', default=cities, choices=cities)
+    parser.add_argument('--mode', default='request', choices=['request', 'retrieval'],
+                        help='request runs handle_request, retrieval only find_relevant_rows')
+    parser.add_argument('--queries', type=int, default=50, help='synthetic queries per category')
+    parser.add_argument('--query-file', help='text file (one query per line) or JSON list used instead')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = run(args.categories, args.cities, args.mode, args.queries, args.repeat, args.seed, args.query_file)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
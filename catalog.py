@@ -0,0 +1,104 @@
+import json
+import sys
+import numpy as np
+import pandas as pd
+import facets
+import responses
+
+# tag column prefixes found across the three workbooks
+TAG_PREFIXES = ['Cuisines', 'Dietary Restrictions', 'Subcategories']
+
+# fields compared in the memory report
+REPORT_FIELDS = ['Address', 'State', 'Website', 'Reviews', 'Description']
+
+
+# compact serving form of one sheet: each row's display fields serialized to JSON once (the
+# only copy of them; records are decoded from it), likes as int32 and tags as CSR index lists
+# (row i -> tag_indices[tag_indptr[i]:tag_indptr[i+1]])
+class Catalog:
+    __slots__ = ('fragments', 'likes', 'tag_names', 'tag_indptr', 'tag_indices')
+
+    def __init__(self, display, likes, tag_frame=None):
+        self.fragments = responses.fragments(display)
+        self.set_likes(likes)
+
+        if tag_frame is None or tag_frame.shape[1] == 0:
+            self.tag_names = []
+            self.tag_indptr = np.zeros(len(display) + 1, dtype=np.int32)
+            self.tag_indices = np.empty(0, dtype=np.uint16)
+            return
+        values = tag_frame.fillna('').astype(str).apply(lambda col: col.str.strip()).to_numpy()
+        present = (values != '') & (values != 'nan')
+        codes, names = pd.factorize(values[present])
+        self.tag_names = [sys.intern(name) for name in names]
+        self.tag_indptr = np.concatenate([[0], np.cumsum(present.sum(axis=1))]).astype(np.int32)
+        self.tag_indices = codes.astype(np.uint16 if len(names) < 2 ** 16 else np.int32)
+
+    def __len__(self):
+        return len(self.likes)
+
+    def set_likes(self, likes):
+        self.likes = np.asarray(likes, dtype=np.int32)
+
+    # display fields of row i, decoded from its fragment
+    def record(self, i):
+        return json.loads(b'{%s}' % self.fragments[i])
+
+    # one display field of every row, e.g. the names a typeahead index is built from
+    def column(self, field):
+        return [self.record(i)[field] for i in range(len(self))]
+
+    # a suggestion for row i whose static fields encode straight from the fragment, with any
+    # extra per-request fields after likes and relevance
+    def suggestion(self, i, relevance, **extra):
+        return responses.Suggestion(self.fragments[i], likes=int(self.likes[i]), relevance=relevance, **extra)
+
+    def tags(self, i):
+        return [self.tag_names[t] for t in self.tag_indices[self.tag_indptr[i]:self.tag_indptr[i + 1]]]
+
+    # bytes held by the arrays, the fragments and the tag names
+    def nbytes(self):
+        arrays = [self.likes, self.tag_indptr, self.tag_indices]
+        total = sum(array.nbytes for array in arrays) + sys.getsizeof(self.fragments)
+        return total + sum(sys.getsizeof(f) for f in self.fragments) + sum(sys.getsizeof(n) for n in self.tag_names)
+
+
+# the report fields, likes and tag columns of a raw sheet
+def _report_frame(df):
+    name_col = next(col for col in df.columns if col.endswith(' Name'))
+    fields = [name_col] + [col for col in REPORT_FIELDS if col in df.columns]
+    tag_cols = [col for prefix in TAG_PREFIXES for col in facets.tag_columns(df, prefix)]
+    likes = pd.to_numeric(df['Number of Likes'], errors='coerce') if 'Number of Likes' in df else 0
+    return df[fields + tag_cols].assign(**{'Number of Likes': likes}), fields, tag_cols
+
+
+# compare the DataFrame and catalog footprint of every sheet in the workbooks
+def memory_report(filepaths):
+    rows = []
+    for filepath in filepaths:
+        for sheet, df in pd.read_excel(filepath, sheet_name=None).items():
+            frame, fields, tag_cols = _report_frame(df)
+            store = Catalog(frame[fields], frame['Number of Likes'].fillna(0), frame[tag_cols])
+            rows.append({
+                'workbook': filepath,
+                'sheet': sheet,
+                'rows': len(df),
+                'dataframe_bytes': int(frame.memory_usage(deep=True).sum()),
+                'catalog_bytes': store.nbytes()
+            })
+    report = pd.DataFrame(rows)
+    report['ratio'] = (report['dataframe_bytes'] / report['catalog_bytes']).round(2)
+    return report
+
+
+if __name__ == "__main__":
+    workbooks = sys.argv[1:] or ['final_attractions.xlsx', 'final_hotels.xlsx', 'final_restaurants.xlsx']
+    report = memory_report(workbooks)
+    print(report.to_string(index=False))
+    totals = report[['dataframe_bytes', 'catalog_bytes']].sum()
+    ratio = totals['dataframe_bytes'] / totals['catalog_bytes']
+    # a catalog bigger than its DataFrames is reported as such, not as "0.8x smaller"
+    change = f"{ratio:.1f}x smaller" if ratio >= 1 else f"{1 / ratio:.1f}x larger"
+    print(f"\nTotal: DataFrames {totals['dataframe_bytes'] / 1e6:.2f} MB, "
+          f"catalogs {totals['catalog_bytes'] / 1e6:.2f} MB "
+          f"({change}, {(totals['catalog_bytes'] - totals['dataframe_bytes']) / 1e6:+.2f} MB)")
@@ -1,8 +1,18 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, g, stream_with_context
 from flask_cors import CORS
 import final_attractions_bot
 import final_hotel_bot
 import final_restaurant_bot
+import corpus
+import cursors
+import responses
+import metrics
+import plan
+import sessions
+import similar
+import streaming
+import typeahead
+import time
 import numpy as np
 
 app = Flask(__name__)
@@ -65,6 +75,64 @@ BOT_CONFIG = {
     }
 }
 
+# largest page or item count a request may ask for
+MAX_LIMIT = 50
+
+# a whole number from lower to upper (no upper bound when it is None), or None for anything
+# else, true/false included
+def bounded_int(value, lower=1, upper=MAX_LIMIT):
+    if isinstance(value, bool) or not isinstance(value, int) or value < lower or (upper is not None and value > upper):
+        return None
+    return value
+
+# fold the embeddings of items a session newly liked into its preference for the category
+def learn_preference(session, category, sheet_name, names):
+    if not names:
+        return
+    config = BOT_CONFIG[category]
+    sheet = corpus.get_sheet(config["filepath"], sheet_name, config["module"].build_sheet)
+    rows = corpus.name_rows(config["filepath"], sheet_name, sheet, config["name_col"])
+    for name in names:
+        if name in rows:
+            sessions.add_preference(session, category, sheet['embeddings'][rows[name]])
+
+# metric labels of a request: its category and city when the server serves them, "unknown"
+# for any other value, so made-up values in a request cannot add series to /metrics
+def request_labels(data):
+    category = str(data.get("category", "")).lower()
+    city = str(data.get("city", "")).lower()
+    cities = {name for settings in BOT_CONFIG.values() for name in settings["sheet"]}
+    return {"category": category if not category or category in BOT_CONFIG else "unknown",
+            "city": city if not city or city in cities else "unknown"}
+
+# label everything recorded during a request with its category and city
+@app.before_request
+def start_timer():
+    g.start = time.perf_counter()
+    g.labels = request_labels(request.get_json(silent=True) or {})
+    metrics.bind(**g.labels)
+
+# a request is timed until its response is closed, i.e. after a streamed body has been sent;
+# the labels are passed along because the request's own are cleared by then
+@app.after_request
+def record_request(response):
+    if request.endpoint != "metrics_endpoint":
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.inc(metrics.REQUESTS, endpoint=endpoint, status=response.status_code)
+        start, labels = g.start, g.labels
+        response.call_on_close(lambda: metrics.observe(metrics.REQUEST_SECONDS, time.perf_counter() - start,
+                                                       endpoint=endpoint, **labels))
+    return response
+
+@app.teardown_request
+def clear_labels(exc):
+    metrics.bind()
+
+# Prometheus scrape endpoint
+@app.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 # connection with bot for incoming stuff
 @app.route("/chat", methods=["POST"])
 def chat():
@@ -72,7 +140,6 @@ def chat():
     city = data.get("city", "").lower()
     category = data.get("category", "").lower()
     query = data.get("query", "").strip()
-    liked = data.get("liked", [])
 
     if not all([city, category, query]):
         return jsonify({"error": "Please provide city, category, and query."}), 400
@@ -87,6 +154,17 @@ def chat():
         return jsonify({"error": f"No data available for {city.title()} {category}."}), 404
 
     try:
+        # likes this session has already sent are not applied again
+        session_id, session = sessions.load(data.get("session_id"))
+        liked = sessions.new_likes(session, sheet_name, data.get("liked", []))
+        learn_preference(session, category, sheet_name, liked)
+
+        # "stream": true sends each stage as one NDJSON line as soon as it completes
+        if data.get("stream"):
+            lines = streaming.chat_lines(config, city, sheet_name, query, liked, session_id, session,
+                                         sessions.preference(session, category))
+            return Response(stream_with_context(lines), mimetype=streaming.NDJSON)
+
         # Use handle_request for API calls
         response = config["module"].handle_request(
             city=city,
@@ -94,9 +172,13 @@ def chat():
             liked=liked,
             sheet_name=sheet_name,
             filepath=config["filepath"],
-            name_col=config["name_col"]
+            name_col=config["name_col"],
+            session=session,
+            preference=sessions.preference(session, category)
         )
-        return jsonify(response)
+        sessions.save(session_id, session)
+        response["session_id"] = session_id
+        return responses.json_response(response)
 
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -110,10 +192,20 @@ def show_more():
     query = data.get("query", "").strip()
     offset = data.get("offset", 0)  # Number of results already shown
     limit = data.get("limit", 2)    # Number of additional results to show
+    cursor = data.get("cursor")     # next_cursor of the previous page
+    session_id = data.get("session_id")
 
-    if not all([city, category, query]):
+    # a cursor or a session stands in for the query
+    if not all([city, category]) or not (query or cursor or session_id):
         return jsonify({"error": "Please provide city, category, and query."}), 400
 
+    if bounded_int(limit) is None or bounded_int(offset, 0, None) is None:
+        return jsonify({"error": f"offset must be a whole number from 0, limit one from 1 to {MAX_LIMIT}."}), 400
+
+    # a cursor that does not decode (or points before the first result) would page forever
+    if cursor and cursors.decode(cursor) is None:
+        return jsonify({"error": "Invalid cursor."}), 400
+
     if category not in BOT_CONFIG:
         return jsonify({"error": f"Unsupported category: {category}"}), 400
 
@@ -124,8 +216,45 @@ def show_more():
         return jsonify({"error": f"No data available for {city.title()} {category}."}), 404
 
     try:
+        bot = config["module"]
+        session, last = None, None
+        if session_id:
+            session_id, session = sessions.load(session_id)
+            last = sessions.results(session, sheet_name, query)
+            # without a cursor, continue the session's last search
+            if not cursor and last is not None:
+                if last["cursor"] is None:
+                    return responses.json_response({"suggestions": [], "next_cursor": None, "session_id": session_id})
+                cursor = last["cursor"]
+
+        if cursor:
+            page = cursors.fetch(cursor, sheet_name, limit)
+            if page is not None:
+                # the next page of the scores frozen when the search ran; retrieval is not run again
+                page_query, offset, ids, relevance, total, next_cursor = page
+                sheet = corpus.get_sheet(config["filepath"], sheet_name, bot.build_sheet)
+                response = {
+                    "suggestions": bot.get_suggestions(sheet, ids, relevance),
+                    "total_results": total,
+                    "offset": offset,
+                    "limit": limit,
+                    "next_cursor": next_cursor
+                }
+                if session is not None:
+                    sessions.remember(session, sheet_name, page_query, next_cursor)
+                    sessions.save(session_id, session)
+                    response["session_id"] = session_id
+                return responses.json_response(response)
+            # the snapshot was evicted: search again from the cursor's position
+            decoded = cursors.decode(cursor)
+            offset = decoded[1] if decoded else offset
+
+        query = query or (last["query"] if last else "")
+        if not query:
+            return jsonify({"error": "These results have expired, please search again."}), 404
+
         # Use handle_request with offset and limit
-        response = config["module"].handle_request(
+        response = bot.handle_request(
             city=city,
             query=query,
             liked=[],
@@ -133,9 +262,14 @@ def show_more():
             filepath=config["filepath"],
             name_col=config["name_col"],
             offset=offset,
-            limit=limit
+            limit=limit,
+            session=session,
+            preference=sessions.preference(session, category) if session is not None else None
         )
-        return jsonify(response)
+        if session is not None:
+            sessions.save(session_id, session)
+            response["session_id"] = session_id
+        return responses.json_response(response)
 
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
@@ -163,18 +297,114 @@ def like_item():
     try:
         bot = config["module"]
         filepath = config["filepath"]
+
+        # a like this session already sent is counted once
+        if data.get("session_id"):
+            session_id, session = sessions.load(data["session_id"])
+            fresh = sessions.new_likes(session, sheet_name, [item_name])
+            learn_preference(session, category, sheet_name, fresh)
+            sessions.save(session_id, session)
+            if not fresh:
+                return jsonify({"success": True, "message": f"Already liked {item_name.title()}"})
         
-        # Load data
-        df = bot.load_data(filepath, sheet_name)
+        # Use the cached sheet so served results see the new like
+        sheet = corpus.get_sheet(filepath, sheet_name, bot.build_sheet)
         
         # Update likes
-        df = bot.update_likes(df, [item_name], filepath, sheet_name)
+        df = bot.update_likes(sheet['df'], [item_name], filepath, sheet_name)
+        sheet['catalog'].set_likes(df['Number of Likes'])
         
         return jsonify({"success": True, "message": f"Successfully liked {item_name.title()}"})
     
     except Exception as e:
         return jsonify({"error": f"Server error: {str(e)}"}), 500
 
+
+# items like a liked one, in the same or another category, from the neighbour graph
+@app.route("/similar", methods=["POST"])
+def similar_endpoint():
+    data = request.get_json()
+    city = data.get("city", "").lower()
+    category = data.get("category", "").lower()
+    target = data.get("target_category", category).lower()
+    item_name = data.get("name", "").lower()
+    limit = data.get("limit", 5)
+
+    if not all([city, category, item_name]):
+        return jsonify({"error": "Please provide city, category, and item name."}), 400
+
+    if bounded_int(limit) is None:
+        return jsonify({"error": f"limit must be a whole number from 1 to {MAX_LIMIT}."}), 400
+
+    if category not in BOT_CONFIG or target not in BOT_CONFIG:
+        return jsonify({"error": f"Unsupported category: {category if category not in BOT_CONFIG else target}"}), 400
+
+    if city not in BOT_CONFIG[category]["sheet"] or city not in BOT_CONFIG[target]["sheet"]:
+        return jsonify({"error": f"No data available for {city.title()} {category}."}), 404
+
+    try:
+        suggestions = similar.similar_items(BOT_CONFIG, city, category, item_name, target, limit)
+        if suggestions is None:
+            return jsonify({"error": f"Unknown item: {item_name.title()}"}), 404
+        return responses.json_response({"suggestions": suggestions, "category": target})
+
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+# typeahead for the chat input: names and tags of one city and category starting with what was typed
+@app.route("/suggest", methods=["GET"])
+def suggest_endpoint():
+    city = request.args.get("city", "").lower()
+    category = request.args.get("category", "").lower()
+    prefix = request.args.get("prefix", "")
+    limit = request.args.get("limit", typeahead.LIMIT, type=int)
+
+    if not all([city, category]):
+        return jsonify({"error": "Please provide city and category."}), 400
+
+    if category not in BOT_CONFIG:
+        return jsonify({"error": f"Unsupported category: {category}"}), 400
+
+    if city not in BOT_CONFIG[category]["sheet"]:
+        return jsonify({"error": f"No data available for {city.title()} {category}."}), 404
+
+    try:
+        return responses.json_response({"suggestions": typeahead.suggest(BOT_CONFIG, city, category, prefix, limit)})
+
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
+
+# an itinerary for liked attractions: stops split over days, restaurants near each stop
+# and hotels central to all of them, in one call
+@app.route("/plan", methods=["POST"])
+def plan_endpoint():
+    data = request.get_json()
+    city = data.get("city", "").lower()
+    names = data.get("attractions", [])
+    days = data.get("days", 1)
+    hotels = data.get("hotels", plan.HOTELS)
+    restaurants = data.get("restaurants", plan.RESTAURANTS)
+
+    if not city or not names:
+        return jsonify({"error": "Please provide city and liked attractions."}), 400
+
+    if not isinstance(days, int) or days < 1:
+        return jsonify({"error": "days must be a positive whole number."}), 400
+
+    if bounded_int(hotels) is None or bounded_int(restaurants) is None:
+        return jsonify({"error": f"hotels and restaurants must be whole numbers from 1 to {MAX_LIMIT}."}), 400
+
+    if any(city not in settings["sheet"] for settings in BOT_CONFIG.values()):
+        return jsonify({"error": f"No data available for {city.title()}."}), 404
+
+    try:
+        return responses.json_response(dict(plan.make_plan(BOT_CONFIG, city, names, days, hotels, restaurants), city=city))
+
+    except Exception as e:
+        return jsonify({"error": f"Server error: {str(e)}"}), 500
+
     
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
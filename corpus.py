@@ -0,0 +1,314 @@
+import threading
+from difflib import SequenceMatcher
+import faiss
+import numpy as np
+import pandas as pd
+import encoder
+import facets
+import geo
+import metrics
+import spelling
+import store
+
+# built sheets keyed by (filepath, sheet_name)
+_sheets = {}
+# facet dictionaries keyed by workbook, one workbook per category
+_facets = {}
+# spelling correctors keyed by the workbooks they were built from
+_spelling = {}
+# lower-cased name -> row maps keyed by (filepath, sheet_name)
+_names = {}
+# lower-cased names in row order keyed by (filepath, sheet_name), readable before the sheet is built
+_name_lists = {}
+# one lock per workbook so concurrent like flushes do not interleave their writes
+_workbook_locks = {}
+# one lock per sheet so concurrent first requests build it once
+_sheet_locks = {}
+_locks_guard = threading.Lock()
+
+
+# fill, stringify and strip text columns in one pass over the frame
+def clean_columns(df, cols):
+    text = df[cols].fillna('').astype(str)
+    for col in cols:
+        df[col] = text[col].str.strip()
+    return df
+
+
+# join text columns row-wise without a Python call per row
+def join_columns(df, cols, sep):
+    return df[cols[0]].str.cat([df[col] for col in cols[1:]], sep=sep)
+
+
+# join the non-empty values of tag columns, e.g. Cuisines 0..N -> "Chinese, Asian"
+def join_nonempty(df, cols, sep=', ', empty=''):
+    joined = pd.Series('', index=df.index, dtype=object)
+    for col in cols:
+        values = df[col].astype(str)
+        joined += np.where(values.isin(['', 'nan']), '', sep + values)
+    joined = joined.str[len(sep):]
+    return joined.mask(joined == '', empty)
+
+
+# filters keeping at most this share of a sheet are scored row by row instead of through the index
+BRUTE_FORCE_RATIO = 0.1
+
+# weights of the blended ranking score; likes enter log-scaled against the sheet's most liked row,
+# preference is the similarity to the centroid of what the session liked
+RANK_WEIGHTS = {'semantic': 0.6, 'name': 0.25, 'likes': 0.15, 'preference': 0.2}
+
+
+# one ranking score per candidate row from semantic similarity (query_vector against the
+# sheet's normalized vectors), name similarity and likes, plus the relevance shown to users;
+# a session's preference vector adds one more matrix-vector product over the candidates
+def blend_scores(ids, query, query_vector, vectors, names, likes, preference=None, weights=RANK_WEIGHTS):
+    candidates = vectors[ids]
+    semantic = candidates @ query_vector
+    name = np.array([SequenceMatcher(None, query, str(names[i])).ratio() for i in ids])
+    popularity = np.log1p(likes[ids]) / np.log1p(max(int(likes.max()), 1)) if len(likes) else np.zeros(len(ids))
+    scores = weights['semantic'] * semantic + weights['name'] * name + weights['likes'] * popularity
+    if preference is not None:
+        scores += weights['preference'] * (candidates @ preference)
+    return scores.astype(np.float32), np.round((semantic + name) / 2, 2).astype(np.float64)
+
+
+# positions of the k best scores, best first, ties in candidate order; argpartition
+# picks them without sorting the rest, so the cost follows the page, not the candidates
+def top_k(scores, k):
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        # rows tied with the k-th score are taken in candidate order, as a stable sort would
+        threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        above = np.flatnonzero(scores > threshold)
+        top = np.concatenate([above, np.flatnonzero(scores == threshold)[:k - len(above)]])
+    else:
+        top = np.arange(len(scores))
+    return top[np.lexsort((top, -scores[top]))]
+
+
+# held while a workbook is read back and rewritten
+def workbook_lock(filepath):
+    with _locks_guard:
+        return _workbook_locks.setdefault(filepath, threading.Lock())
+
+
+# the pipeline's stored copy of a sheet when there is one, the workbook otherwise
+def read_sheet(filepath, sheet_name):
+    df = store.read_sheet(filepath, sheet_name)
+    return df if df is not None else pd.read_excel(filepath, sheet_name=sheet_name)
+
+
+# fill a sheet's index chunk by chunk: vectors the pipeline pooled for the text where
+# there are some, the bot's encoder otherwise; add(vectors, index) creates or extends it.
+# Only one chunk of vectors exists outside the index at a time
+def build_index(df, embed, add, chunk_rows=encoder.CHUNK_ROWS):
+    model_name = encoder.model_id()
+    index = None
+    for start in range(0, len(df), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows]
+        vectors = store.lookup_vectors(chunk['search_text'], model_name)
+        index = add(vectors if vectors is not None else embed(chunk), index)
+    return index
+
+
+# the index file indexer.py wrote for a sheet, when it was built from exactly these texts;
+# the sheet is embedded and indexed here otherwise
+def load_index(filepath, sheet_name, df, embed, add):
+    model_name = encoder.model_id()
+    entry = store.read_manifest(store.index_manifest_path(model_name)).get(store.index_key(filepath, sheet_name))
+    index = None
+    if entry and entry['texts'] == store.texts_digest(df['search_text']):
+        index = store.read_index(filepath, sheet_name, model_name)
+    metrics.inc(metrics.CACHE_REQUESTS, cache='index', result='hit' if index is not None else 'miss')
+    return index if index is not None else build_index(df, embed, add)
+
+
+def _query(query_vector):
+    return np.ascontiguousarray(query_vector, dtype='float32').reshape(1, -1)
+
+
+# search parameters restricting FAISS to the rows of a mask; the bitmap must outlive the search
+def _restrict(mask):
+    bitmap = np.packbits(mask, bitorder='little')
+    return faiss.SearchParameters(sel=faiss.IDSelectorBitmap(len(mask), faiss.swig_ptr(bitmap))), bitmap
+
+
+# the k nearest rows of one query vector as (ids, scores), best first. A row mask is pushed
+# into the FAISS search as a bitmap selector, so a filtered query is one search; masks that
+# keep only a few rows skip the index and score those rows directly
+def search(index, query_vector, k, mask=None):
+    query = _query(query_vector)
+    if mask is None:
+        scores, ids = index.search(query, min(k, index.ntotal))
+    else:
+        rows = np.flatnonzero(mask)
+        k = min(k, len(rows))
+        if k == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        if len(rows) <= BRUTE_FORCE_RATIO * index.ntotal:
+            row_scores = index_vectors(index)[rows] @ query[0]
+            top = top_k(row_scores, k)
+            return rows[top], row_scores[top]
+        params, _bitmap = _restrict(mask)
+        scores, ids = index.search(query, k, params=params)
+    found = ids[0] >= 0
+    return ids[0][found], scores[0][found]
+
+
+# every row scoring above threshold, best first and at most max_results, in one range search
+def range_search(index, query_vector, threshold, max_results, mask=None):
+    query = _query(query_vector)
+    if mask is not None and mask.sum() <= BRUTE_FORCE_RATIO * index.ntotal:
+        ids = np.flatnonzero(mask)
+        scores = index_vectors(index)[ids] @ query[0]
+        ids, scores = ids[scores > threshold], scores[scores > threshold]
+    elif mask is not None:
+        params, _bitmap = _restrict(mask)
+        _, scores, ids = index.range_search(query, threshold, params=params)
+    else:
+        _, scores, ids = index.range_search(query, threshold)
+    top = top_k(scores, max_results)
+    return ids[top].astype(np.int64), scores[top]
+
+
+# semantic candidates under a bot's settings: 'range' returns every row above the threshold
+# in one range search; 'knn' starts at k and doubles it while every hit passes the threshold
+# and fewer than needed (the rows up to the requested page) were found. Both stop at max_results
+def retrieve(index, query_vector, settings, needed=0, mask=None):
+    threshold, cap = settings['threshold'], settings['max_results']
+    if settings['mode'] == 'range':
+        return range_search(index, query_vector, threshold, cap, mask)
+    k = min(max(settings['k'], needed), cap)
+    while True:
+        ids, scores = search(index, query_vector, k, mask)
+        if threshold is None:
+            return ids, scores
+        passed = scores > threshold
+        if not passed.all() or passed.sum() >= needed or len(ids) < k or k >= cap:
+            return ids[passed], scores[passed]
+        k = min(2 * k, cap)
+
+
+# the vectors held by a flat index as a view, not a copy; valid while the index lives
+def index_vectors(index):
+    return faiss.rev_swig_ptr(index.get_xb(), index.ntotal * index.d).reshape(index.ntotal, index.d)
+
+
+# persist likes into the stored sheet, or into the workbook's likes column when there is none;
+# the served frame does not hold every column, so only the likes are written back
+def flush_likes(df, filepath, sheet_name):
+    with metrics.timer(metrics.LIKE_FLUSH_LAG_SECONDS), workbook_lock(filepath), metrics.timer(metrics.LIKE_FLUSH_SECONDS):
+        if store.has_sheet(filepath, sheet_name):
+            store.write_likes(filepath, sheet_name, df['Number of Likes'])
+            return
+        with pd.ExcelFile(filepath, engine='openpyxl') as reader:
+            sheets = {sheet: pd.read_excel(reader, sheet_name=sheet) for sheet in reader.sheet_names}
+        sheets[sheet_name]['Number of Likes'] = df['Number of Likes'].to_numpy()
+        with pd.ExcelWriter(filepath, engine='openpyxl') as writer:
+            for sheet, data in sheets.items():
+                data.to_excel(writer, sheet_name=sheet, index=False)
+
+
+# the sheet's grid index over the coordinates the pipeline stored; a sheet it has not
+# processed is geocoded here from its addresses
+def build_grid(df):
+    if not set(geo.COLUMNS) <= set(df.columns):
+        df = geo.add_coordinates(df)
+    return geo.GridIndex(df['Latitude'].to_numpy(dtype=float), df['Longitude'].to_numpy(dtype=float))
+
+
+# rows within the radius of the place a query names ("near klcc", "within 3 km of kuah"),
+# nearest first; None when the query names no place the gazetteer knows, or one no row is near
+def nearby(query, grid):
+    place = geo.parse_place(query)
+    if place is None or grid is None:
+        return None
+    ids, _ = grid.within(place['lat'], place['lon'], place['radius'])
+    return ids if len(ids) > 0 else None
+
+
+# row of each lower-cased name in a built sheet, first occurrence winning; built once per sheet
+def name_rows(filepath, sheet_name, sheet, name_col):
+    key = (filepath, sheet_name)
+    if key not in _names:
+        names = sheet['df'][name_col].astype(str).str.lower().str.strip()
+        _names[key] = {name: row for row, name in reversed(list(enumerate(names)))}
+    return _names[key]
+
+
+# lower-cased names of a sheet in row order: the built sheet's when it is in memory, the name
+# column alone otherwise (the stored copy's, the workbook's when there is none), so a cold
+# sheet's names are read in milliseconds without building it
+def sheet_names(filepath, sheet_name, name_col):
+    key = (filepath, sheet_name)
+    if key not in _name_lists:
+        if key in _sheets:
+            names = _sheets[key]['df'][name_col]
+        else:
+            names = store.read_column(filepath, sheet_name, name_col)
+            if names is None:
+                names = pd.read_excel(filepath, sheet_name=sheet_name, usecols=[name_col])[name_col]
+        _name_lists[key] = names.fillna('').astype(str).str.lower().str.strip().to_numpy()
+    return _name_lists[key]
+
+
+# the sheet when it is already built, None otherwise
+def built_sheet(filepath, sheet_name):
+    return _sheets.get((filepath, sheet_name))
+
+
+# build a sheet once and serve it from memory afterwards; a cold sheet is built under its own
+# lock and looked up again once it is held, so requests arriving during the build wait for it
+# instead of building it again, and other sheets are served meanwhile
+def get_sheet(filepath, sheet_name, build):
+    key = (filepath, sheet_name)
+    sheet = _sheets.get(key)
+    metrics.inc(metrics.CACHE_REQUESTS, cache='sheet', result='hit' if sheet is not None else 'miss')
+    if sheet is not None:
+        return sheet
+    with _locks_guard:
+        lock = _sheet_locks.setdefault(key, threading.Lock())
+    with lock:
+        if key not in _sheets:
+            _sheets[key] = build(filepath, sheet_name)
+        return _sheets[key]
+
+
+# scan every sheet of a workbook once and merge their tags
+def get_facets(filepath, fields, keywords=None):
+    metrics.inc(metrics.CACHE_REQUESTS, cache='facets', result='hit' if filepath in _facets else 'miss')
+    if filepath not in _facets:
+        frames = pd.read_excel(filepath, sheet_name=None)
+        frames.update(store.read_sheets(filepath))
+        sheet_tags = {sheet: facets.scan_tags(df, fields, keywords) for sheet, df in frames.items()}
+        _facets[filepath] = facets.build_facets(sheet_tags)
+    return _facets[filepath]
+
+
+# workbooks sharing one spelling vocabulary, so a food word typed to the hotel bot is not "corrected"
+SPELLING_WORKBOOKS = ('final_attractions.xlsx', 'final_hotels.xlsx', 'final_restaurants.xlsx')
+
+
+# one spelling corrector over the words of every sheet of the workbooks and the gazetteer's places
+def get_spelling(filepaths=SPELLING_WORKBOOKS):
+    key = tuple(filepaths)
+    metrics.inc(metrics.CACHE_REQUESTS, cache='spelling', result='hit' if key in _spelling else 'miss')
+    if key not in _spelling:
+        frames = []
+        for filepath in key:
+            workbook = pd.read_excel(filepath, sheet_name=None)
+            workbook.update(store.read_sheets(filepath))
+            frames.extend(workbook.values())
+        _spelling[key] = spelling.SpellChecker(*spelling.vocabulary(frames, geo.gazetteer()[0]))
+    return _spelling[key]
+
+
+# build every configured sheet up front, e.g. before serving traffic
+def build_corpus(config):
+    for category, settings in config.items():
+        for city, sheet_name in settings['sheet'].items():
+            metrics.bind(category=category, city=city)
+            get_sheet(settings['filepath'], sheet_name, settings['module'].build_sheet)
+    metrics.bind()
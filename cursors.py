@@ -0,0 +1,67 @@
+import base64
+import threading
+import uuid
+from collections import OrderedDict
+import numpy as np
+import corpus
+
+# scored candidate lists kept for paging; the least recently used are dropped first
+MAX_SNAPSHOTS = 10000
+
+_snapshots = OrderedDict()
+_lock = threading.Lock()
+
+
+# opaque to clients: "<snapshot id>:<offset>" in URL-safe base64
+def encode(snapshot_id, offset):
+    return base64.urlsafe_b64encode(f'{snapshot_id}:{offset}'.encode('ascii')).decode('ascii').rstrip('=')
+
+
+# (snapshot id, offset), or None for a malformed cursor or a negative offset
+def decode(cursor):
+    try:
+        snapshot_id, _, offset = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii').partition(':')
+        offset = int(offset)
+    except (ValueError, TypeError):
+        return None
+    return (snapshot_id, offset) if offset >= 0 else None
+
+
+# freeze a search's candidates and scores and return the cursor of the page after
+# the one shown, or None when everything was shown
+def snapshot(sheet_name, query, ids, scores, relevance, shown):
+    if shown >= len(ids):
+        return None
+    snapshot_id = uuid.uuid4().hex
+    with _lock:
+        _snapshots[snapshot_id] = {'sheet': sheet_name, 'query': query, 'ids': np.asarray(ids, dtype=np.int32),
+                                   'scores': np.asarray(scores, dtype=np.float32),
+                                   'relevance': np.asarray(relevance, dtype=np.float64)}
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+    return encode(snapshot_id, shown)
+
+
+# the page a cursor points at: (query, offset, row ids, relevance, total, next cursor),
+# or None when the snapshot was evicted or belongs to another sheet. The scores are
+# frozen, so likes that land between pages never make a page repeat or skip an item.
+# The candidates are ranked once, when the first page is fetched, and every page is a
+# slice of that order
+def fetch(cursor, sheet_name, limit):
+    decoded = decode(cursor)
+    if decoded is None:
+        return None
+    snapshot_id, offset = decoded
+    with _lock:
+        snap = _snapshots.get(snapshot_id)
+        if snap is None or snap['sheet'] != sheet_name:
+            return None
+        _snapshots.move_to_end(snapshot_id)
+    order = snap.get('order')
+    if order is None:
+        # concurrent first fetches compute the same order, so whichever is stored is right
+        order = snap['order'] = corpus.top_k(snap['scores'], len(snap['scores']))
+    top = order[offset:offset + limit]
+    end = offset + len(top)
+    next_cursor = encode(snapshot_id, end) if end < len(snap['ids']) else None
+    return snap['query'], offset, snap['ids'][top], snap['relevance'][top], len(snap['ids']), next_cursor
@@ -0,0 +1,78 @@
+import hashlib
+import os
+import re
+import numpy as np
+
+MODEL_NAME = 'all-MiniLM-L6-v2'
+DIMENSION = 384
+
+# rows encoded per chunk by encode_chunks, and texts per forward pass inside a chunk
+CHUNK_ROWS = 1024
+BATCH_SIZE = 64
+
+# TRIP_ENCODER=stub swaps the model for HashingEncoder, e.g. for load tests on CI
+ENCODER_ENV = 'TRIP_ENCODER'
+
+_model = None
+
+
+# deterministic bag-of-words embedder with the model's encode() signature;
+# needs no download, so server, cache and I/O costs can be measured on their own
+class HashingEncoder:
+    def __init__(self, dimension=DIMENSION):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def _embed(self, text):
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r'\w+', str(text).lower()):
+            digest = int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'little')
+            vector[digest % self.dimension] += 1.0 if (digest >> 32) & 1 else -1.0
+        return vector
+
+    def encode(self, sentences, convert_to_tensor=False, convert_to_numpy=True, normalize_embeddings=False, **kwargs):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        vectors = np.stack([self._embed(text) for text in texts]) if texts else np.zeros((0, self.dimension), dtype=np.float32)
+        if normalize_embeddings:
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors /= np.where(norms == 0, 1, norms)
+        if single:
+            vectors = vectors[0]
+        if convert_to_tensor:
+            import torch
+            return torch.from_numpy(vectors)
+        return vectors
+
+
+def stub_enabled():
+    return os.environ.get(ENCODER_ENV, '').lower() == 'stub'
+
+
+# names the vectors the current encoder produces, so stored ones are never mixed up
+def model_id():
+    return f'stub-hash-{DIMENSION}' if stub_enabled() else MODEL_NAME
+
+
+# the shared sentence encoder, loaded once per process
+def get_model():
+    global _model
+    if _model is None:
+        if stub_enabled():
+            _model = HashingEncoder()
+        else:
+            from sentence_transformers import SentenceTransformer
+            _model = SentenceTransformer(MODEL_NAME)
+    return _model
+
+
+# encode texts a chunk at a time, yielding float32 arrays in order, so callers
+# can add each chunk to an index or a file before the next one is encoded
+def encode_chunks(texts, chunk_rows=CHUNK_ROWS, batch_size=BATCH_SIZE, normalize=True):
+    model = get_model()
+    for start in range(0, len(texts), chunk_rows):
+        chunk = list(texts[start:start + chunk_rows])
+        yield np.asarray(model.encode(chunk, batch_size=batch_size, convert_to_numpy=True,
+                                      normalize_embeddings=normalize), dtype='float32')
@@ -0,0 +1,140 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import corpus
+import encoder
+from chatbot_server import BOT_CONFIG
+
+# per category: facet field the labels are judged against, labels, query template.
+# The labels are the ones the old per-sheet metric scripts used
+EVAL_QUERIES = {
+    'restaurants': ('cuisine', ['indian', 'italian', 'asian', 'thai', 'malaysian', 'chinese'], '{} restaurant'),
+    'attractions': ('type', ['shopping', 'museums', 'nightlife', 'zoos', 'sights & landmarks', 'fun & games'], '{} attraction'),
+    'hotels': ('type', ['resort', 'homestay', 'hostel', 'apartment', 'villa', 'guesthouse'], '{} hotel'),
+}
+
+METRICS = ['recall', 'precision', 'mrr', 'ndcg']
+
+
+# row ids of a sheet whose tags in field contain the label, e.g. "zoos" -> "zoos & aquariums"
+def relevant_rows(facet_index, field, sheet_name, label):
+    ids = [entry['rows'][sheet_name]
+           for tag, entry in facet_index['tags'].get(field, {}).items()
+           if label in tag and sheet_name in entry['rows']]
+    return set(np.concatenate(ids).tolist()) if ids else set()
+
+
+# the labels to evaluate on one sheet: the fixed list, or every tag with enough rows
+def sheet_labels(facet_index, field, sheet_name, labels, all_tags, min_relevant):
+    if not all_tags:
+        return labels
+    return sorted(tag for tag, entry in facet_index['tags'].get(field, {}).items()
+                  if len(entry['rows'].get(sheet_name, ())) >= min_relevant)
+
+
+# recall, precision, reciprocal rank and nDCG of one ranked list with binary relevance
+def score(retrieved, relevant, k):
+    retrieved = list(retrieved)[:k]
+    hits = [1.0 if i in relevant else 0.0 for i in retrieved]
+    first = next((rank for rank, hit in enumerate(hits) if hit), None)
+    discounts = 1 / np.log2(np.arange(2, k + 2))
+    ideal = discounts[:min(len(relevant), k)].sum()
+    return {
+        'recall': sum(hits) / len(relevant) if relevant else 0.0,
+        'precision': sum(hits) / len(retrieved) if retrieved else 0.0,
+        'mrr': 1 / (first + 1) if first is not None else 0.0,
+        'ndcg': float(np.dot(hits, discounts[:len(hits)]) / ideal) if ideal else 0.0,
+    }
+
+
+# rank every query of a sheet with one batched encode and search of the semantic index.
+# The served pipeline is not evaluated: find_relevant_rows filters on the same facet tags
+# the labels are judged with, so its scores would be 1.0 by construction
+def retrieve(sheet, queries, k):
+    vectors = encoder.get_model().encode([query.lower() for query in queries], normalize_embeddings=True)
+    _, indices = sheet['index'].search(np.asarray(vectors, dtype='float32'), k)
+    return [row[row >= 0] for row in indices]
+
+
+def evaluate_sheet(category, city, k, all_tags, min_relevant):
+    settings = BOT_CONFIG[category]
+    module, sheet_name = settings['module'], settings['sheet'][city]
+    field, labels, template = EVAL_QUERIES[category]
+
+    start = time.perf_counter()
+    sheet = corpus.get_sheet(settings['filepath'], sheet_name, module.build_sheet)
+    build_seconds = time.perf_counter() - start
+
+    judged = [(label, relevant_rows(sheet['facets'], field, sheet_name, label))
+              for label in sheet_labels(sheet['facets'], field, sheet_name, labels, all_tags, min_relevant)]
+    judged = [(label, relevant) for label, relevant in judged if relevant]
+    queries = [template.format(label) for label, _ in judged]
+
+    start = time.perf_counter()
+    rankings = retrieve(sheet, queries, k) if queries else []
+    search_seconds = time.perf_counter() - start
+
+    rows = []
+    for (label, relevant), query, ranking in zip(judged, queries, rankings):
+        row = {'category': category, 'city': city, 'sheet': sheet_name, 'label': label, 'query': query,
+               'relevant': len(relevant), 'retrieved': len(ranking)}
+        row.update(score(ranking.tolist(), relevant, k))
+        rows.append(row)
+    timing = {'category': category, 'city': city, 'build_seconds': round(build_seconds, 3),
+              'search_seconds': round(search_seconds, 4), 'queries': len(queries)}
+    return rows, timing
+
+
+def summarize(results, keys):
+    if results.empty:
+        return []
+    summary = results.groupby(keys)[METRICS].mean().round(4)
+    summary['queries'] = results.groupby(keys).size()
+    return summary.reset_index().to_dict('records')
+
+
+def run(categories, cities, k=6, all_tags=False, min_relevant=1, workers=None):
+    jobs = [(category, city) for category in categories for city in cities if city in BOT_CONFIG[category]['sheet']]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(evaluate_sheet, category, city, k, all_tags, min_relevant)
+                   for category, city in jobs]
+        outcomes = [future.result() for future in futures]
+
+    results = pd.DataFrame([row for rows, _ in outcomes for row in rows],
+                           columns=['category', 'city', 'sheet', 'label', 'query', 'relevant', 'retrieved'] + METRICS)
+    overall = results[METRICS].mean().round(4).to_dict() if not results.empty else {}
+    return results, {
+        'config': {'k': k, 'categories': categories, 'cities': cities, 'all_tags': all_tags,
+                   'min_relevant': min_relevant, 'encoder': encoder.model_id()},
+        'overall': overall,
+        'categories': summarize(results, ['category']),
+        'sheets': summarize(results, ['category', 'city']),
+        'timings': [timing for _, timing in outcomes],
+        'queries': results.to_dict('records')
+    }
+
+
+if __name__ == "__main__":
+    cities = sorted(BOT_CONFIG['restaurants']['sheet'])
+    parser = argparse.ArgumentParser(description='Recall, precision, MRR and nDCG of the search over every sheet.')
+    parser.add_argument('--categories', nargs='+', default=list(BOT_CONFIG), choices=list(BOT_CONFIG))
+    parser.add_argument('--cities', nargs='+', default=cities, choices=cities)
+    parser.add_argument('-k', type=int, default=6)
+    parser.add_argument('--all-tags', action='store_true', help='evaluate every tag of the sheet, not only the fixed labels')
+    parser.add_argument('--min-relevant', type=int, default=3, help='with --all-tags, skip tags on fewer rows')
+    parser.add_argument('--workers', type=int, help='processes evaluating sheets in parallel')
+    parser.add_argument('--output-dir', default='evaluation', help='evaluation.json and evaluation.csv are written here')
+    args = parser.parse_args()
+
+    results, report = run(args.categories, args.cities, args.k, args.all_tags, args.min_relevant, args.workers)
+    os.makedirs(args.output_dir, exist_ok=True)
+    results.to_csv(os.path.join(args.output_dir, 'evaluation.csv'), index=False)
+    with open(os.path.join(args.output_dir, 'evaluation.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    print(pd.DataFrame(report['categories']).to_string(index=False))
+    print(f"\nOverall @{args.k}: " + ', '.join(f'{m} {v:.3f}' for m, v in report['overall'].items()))
@@ -0,0 +1,160 @@
+import re
+import numpy as np
+import pandas as pd
+
+# hand-kept aliases for tags that users phrase differently from the data
+ALIASES = {
+    'malay': 'malaysian',
+    'nyonya': 'nonya',
+    'peranakan': 'nonya',
+    'bbq': 'barbecue',
+    'coffee': 'cafe',
+    'steak': 'steakhouse',
+    'western': 'european',
+    'vegetarian': 'vegetarian friendly',
+    'vegan': 'vegan options',
+    'gluten-free': 'gluten free options',
+    'gluten free': 'gluten free options',
+    'muslim friendly': 'halal',
+    'zoo': 'zoos & aquariums',
+    'aquarium': 'zoos & aquariums',
+    'spa': 'spas & wellness',
+    'theme park': 'water & amusement parks',
+    'water park': 'water & amusement parks',
+    'kl': 'kuala lumpur',
+    'jb': 'johor bahru',
+    'penang': 'penang island',
+    'guest house': 'guesthouse',
+}
+
+# fields that only match when the query names a place
+LOCATION_CUES = ('in', 'near', 'around', 'at')
+
+SUFFIXES = (' friendly', ' options', ' restaurants')
+
+
+# numbered tag columns such as "Cuisines 0".."Cuisines 6"
+def tag_columns(df, prefix):
+    pattern = re.compile(rf'{re.escape(prefix)} \d+$', re.IGNORECASE)
+    return [col for col in df.columns if pattern.match(col)]
+
+
+def _normalise(values):
+    return values.fillna('').astype(str).str.strip().str.lower()
+
+
+def extract_area(addresses):
+    # "Jalan Dato Sagor, Ipoh 30000 Malaysia" -> "ipoh"
+    area = _normalise(addresses).str.extract(r'(?:^|,)\s*([^,\d]+?)\s*(?:\d{5})?\s+malaysia\s*$')[0]
+    return area.fillna('').str.strip()
+
+
+# scan one sheet: field -> tag -> row ids
+# fields map to a column prefix ("Cuisines" -> "Cuisines 0".."Cuisines N");
+# keywords map a field to (column, vocabulary) for sheets without tag columns
+def scan_tags(df, fields, keywords=None):
+    tags = {}
+    for field, prefix in fields.items():
+        cols = tag_columns(df, prefix)
+        if not cols:
+            continue
+        values = pd.concat([_normalise(df[col]) for col in cols], keys=range(len(cols)))
+        values = values[values != '']
+        rows = values.index.get_level_values(1).to_numpy()
+        tags[field] = {tag: np.unique(rows[values.to_numpy() == tag]) for tag in values.unique()}
+
+    for field, (col, vocabulary) in (keywords or {}).items():
+        text = _normalise(df[col])
+        tags[field] = {}
+        for tag in vocabulary:
+            ids = np.flatnonzero(text.str.contains(rf'\b{re.escape(tag)}s?\b', regex=True).to_numpy())
+            if len(ids):
+                tags[field][tag] = ids
+
+    if 'Address' in df.columns:
+        area = extract_area(df['Address']).to_numpy()
+        tags['area'] = {tag: np.flatnonzero(area == tag) for tag in np.unique(area) if tag}
+    return tags
+
+
+def _variants(tag):
+    variants = {tag, tag.replace('-', ' '), tag.replace(' ', '-')}
+    if ' & ' in tag:
+        variants |= {tag.replace(' & ', ' and '), tag.replace(' & ', ' ')}
+    for suffix in SUFFIXES:
+        if tag.endswith(suffix):
+            variants.add(tag[:-len(suffix)])
+    if tag.endswith('s') and not tag.endswith('ss'):
+        variants.add(tag[:-1])
+    else:
+        variants.add(tag + 's')
+    return variants
+
+
+# merge the per-sheet scans of a workbook into one facet dictionary
+def build_facets(sheet_tags):
+    tags = {}
+    for sheet, fields in sheet_tags.items():
+        for field, values in fields.items():
+            field_tags = tags.setdefault(field, {})
+            for tag, ids in values.items():
+                entry = field_tags.setdefault(tag, {'count': 0, 'rows': {}})
+                entry['count'] += len(ids)
+                entry['rows'][sheet] = ids
+
+    # phrase -> (field, tag); tags claim their own name first, and variants
+    # claimed by more than one tag are dropped
+    synonyms = {tag: (field, tag) for field, field_tags in tags.items() for tag in field_tags}
+    variants, ambiguous = {}, set()
+    for field, field_tags in tags.items():
+        for tag in field_tags:
+            for phrase in _variants(tag) - synonyms.keys():
+                if phrase in variants and variants[phrase] != (field, tag):
+                    ambiguous.add(phrase)
+                variants.setdefault(phrase, (field, tag))
+    synonyms.update((phrase, target) for phrase, target in variants.items() if phrase not in ambiguous)
+    for alias, tag in ALIASES.items():
+        for field, field_tags in tags.items():
+            if tag in field_tags:
+                synonyms.setdefault(alias, (field, tag))
+                break
+
+    # longest phrase first so "sri lankan" wins over "lankan"
+    phrases = sorted(synonyms, key=len, reverse=True)
+    pattern = re.compile(r'(?<![\w-])(non-|not |no )?(' + '|'.join(re.escape(p) for p in phrases) + r')(?![\w-])') if phrases else None
+    return {'tags': tags, 'synonyms': synonyms, 'pattern': pattern}
+
+
+# find the facet tags a query mentions: [(field, tag, negated)]
+def match_query(query, facets):
+    if facets['pattern'] is None:
+        return []
+    query_lower = query.lower()
+    matches = []
+    for found in facets['pattern'].finditer(query_lower):
+        field, tag = facets['synonyms'][found.group(2)]
+        if field == 'area':
+            before = query_lower[:found.start()].split()
+            if not before or before[-1] not in LOCATION_CUES:
+                continue
+        match = (field, tag, found.group(1) is not None)
+        if match not in matches:
+            matches.append(match)
+    return matches
+
+
+# rows of one sheet satisfying the matched tags: OR within a field, AND across fields
+def filter_mask(facets, sheet, matches, n_rows):
+    mask = np.ones(n_rows, dtype=bool)
+    include = {}
+    for field, tag, negated in matches:
+        ids = facets['tags'][field][tag]['rows'].get(sheet, np.empty(0, dtype=int))
+        if negated:
+            mask[ids] = False
+        else:
+            include.setdefault(field, []).append(ids)
+    for ids in include.values():
+        field_mask = np.zeros(n_rows, dtype=bool)
+        field_mask[np.concatenate(ids)] = True
+        mask &= field_mask
+    return mask
@@ -1,55 +1,135 @@
 import pandas as pd
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
 from difflib import SequenceMatcher
+import catalog
+import corpus
+import cursors
+import encoder
+import facets
+import metrics
+import sessions
 
 # Load the model once
-model = SentenceTransformer('all-MiniLM-L6-v2')
+model = encoder.get_model()
+
+# tag columns scanned into the facet dictionary at build time
+FACET_FIELDS = {'type': 'Subcategories'}
+
+# semantic retrieval (corpus.retrieve): every row above the similarity threshold in one
+# range search, capped at max_results, so later pages come from the same search
+SEMANTIC_SEARCH = {'mode': 'range', 'threshold': 0.3, 'k': 10, 'max_results': 100}
+
+# display-only columns, dropped from the served frame once the catalog holds them
+DISPLAY_COLUMNS = ['Description', 'Reviews', 'Website', 'Country']
 
 # step 1
+@metrics.timed('load_data')
 def load_data(filepath, sheet_name):
-    return pd.read_excel(filepath, sheet_name=sheet_name)
+    return corpus.read_sheet(filepath, sheet_name)
 
 # step 2
+@metrics.timed('preprocess_text')
 def preprocess_text(df):
     subcats = ['Subcategories 0', 'Subcategories 1', 'Subcategories 2', 'Subcategories 3']
     subcats = [col for col in subcats if col in df.columns]
     text_cols = ['Category'] + subcats + ['Description']
     df[text_cols] = df[text_cols].astype(str)
-    df['search_text'] = df[text_cols].agg(' '.join, axis=1).str.lower()
+    df['search_text'] = corpus.join_columns(df, text_cols, ' ').str.lower()
     df['Attraction Name'] = df['Attraction Name'].astype(str).str.lower()
     return df
 
 # step 3
+@metrics.timed('create_embeddings')
 def create_embeddings(df):
-    return model.encode(df['search_text'].values, convert_to_numpy=True, normalize_embeddings=True)
+    return model.encode(df['search_text'].tolist(), convert_to_numpy=True, normalize_embeddings=True, batch_size=encoder.BATCH_SIZE)
 
 # step 4
-def create_faiss_index(embeddings):
-    index = faiss.IndexFlatIP(embeddings.shape[1])
-    index.add(embeddings)
+@metrics.timed('create_faiss_index')
+def create_faiss_index(embeddings, index=None):
+    if index is None:
+        index = faiss.IndexFlatIP(embeddings.shape[1])
+    index.add(np.ascontiguousarray(embeddings, dtype='float32'))
     return index
 
 # step 5
-def find_relevant_rows(query, df, index, embeddings):
+@metrics.timed('find_relevant_rows')
+def find_relevant_rows(query, df, index, embeddings, facet_index, sheet_name, needed=0, grid=None):
     query_lower = query.lower().strip()
 
-    name_matches = df[df['Attraction Name'].apply(
-        lambda x: SequenceMatcher(None, x, query_lower).ratio() > 0.8
-    )]
-    if not name_matches.empty:
+    name_matches = np.flatnonzero([
+        SequenceMatcher(None, x, query_lower).ratio() > 0.8 for x in df['Attraction Name'].to_numpy()
+    ])
+    if len(name_matches) > 0:
         return name_matches
 
+    # A place after "near", "in" or "within 2 km of" is a radius around its gazetteer point,
+    # answered by the sheet's grid index
+    near = corpus.nearby(query_lower, grid)
+
+    # Subcategory and area tags from the facet dictionary
+    matches = facets.match_query(query_lower, facet_index)
+    if matches:
+        mask = facets.filter_mask(facet_index, sheet_name, matches, len(df))
+        if near is not None:
+            # only the tagged rows within the radius
+            within = np.zeros(len(df), dtype=bool)
+            within[near] = True
+            mask &= within
+        if mask.any():
+            # the filter is pushed into the semantic search, which orders the tagged rows
+            query_embedding = model.encode([query_lower], normalize_embeddings=True)[0]
+            tag_matches, _ = corpus.search(index, query_embedding, SEMANTIC_SEARCH['max_results'], mask)
+            return tag_matches
+
+    if near is not None:
+        return near
+
     query_embedding = model.encode([query_lower], normalize_embeddings=True)
-    distances, indices = index.search(query_embedding, k=5)
-    return df.iloc[indices[0]]
+    semantic_matches, _ = corpus.retrieve(index, query_embedding[0], SEMANTIC_SEARCH, needed)
+    return semantic_matches
 
 # step 6
 def get_relevant_info(df):
-    cols = ['Attraction Name', 'Address', 'State', 'Country',
-            'Description', 'Category', 'Reviews', 'Website', 'Number of Likes']
-    return df[[c for c in cols if c in df.columns]]
+    address = corpus.join_columns(df[['Address', 'State', 'Country']].astype(str),
+                                  ['Address', 'State', 'Country'], ', ').str.strip(', ')
+
+    # static display fields of every row, packed into the catalog at build time
+    return pd.DataFrame({
+        "name": df['Attraction Name'].str.title(),
+        "description": df['Description'],
+        "address": address,
+        "reviews": df['Reviews'],
+        "website": df['Website'],
+        "category": df['Category']
+    })
+
+# score every candidate once: the blended ranking score and the relevance shown
+@metrics.timed('scoring')
+def score_rows(sheet, ids, query, preference=None):
+    query_embedding = model.encode([query.lower()], normalize_embeddings=True)[0]
+    names = sheet['df']['Attraction Name'].to_numpy()
+    return corpus.blend_scores(ids, query.lower(), query_embedding, sheet['embeddings'], names, sheet['catalog'].likes,
+                               preference)
+
+# fill in the per-query fields for the rows on one page
+def get_suggestions(sheet, ids, relevance):
+    return [sheet['catalog'].suggestion(i, float(score)) for i, score in zip(ids, relevance)]
+
+# steps 1-4 plus facets, run once per sheet and cached by corpus
+def build_sheet(filepath, sheet_name):
+    df = preprocess_text(load_data(filepath, sheet_name))
+    df['Number of Likes'] = pd.to_numeric(df['Number of Likes'], errors='coerce').fillna(0).astype(int)
+    index = corpus.load_index(filepath, sheet_name, df, create_embeddings, create_faiss_index)
+    return {
+        'embeddings': corpus.index_vectors(index),
+        'index': index,
+        'facets': corpus.get_facets(filepath, FACET_FIELDS),
+        'grid': corpus.build_grid(df),
+        'spelling': corpus.get_spelling(),
+        'catalog': catalog.Catalog(get_relevant_info(df), df['Number of Likes'], df[facets.tag_columns(df, 'Subcategories')]),
+        'df': df.drop(columns=DISPLAY_COLUMNS, errors='ignore')
+    }
 
 # step 7
 def update_likes(df, liked, path=None, sheet=None):
@@ -60,98 +140,91 @@ def update_likes(df, liked, path=None, sheet=None):
 
     if path and sheet:
         try:
-            with pd.ExcelFile(path, engine='openpyxl') as reader:
-                sheets = {s: pd.read_excel(reader, sheet_name=s) for s in reader.sheet_names}
-            sheets[sheet] = df
-            with pd.ExcelWriter(path, engine='openpyxl') as writer:
-                for s, data in sheets.items():
-                    data.to_excel(writer, sheet_name=s, index=False)
+            corpus.flush_likes(df, path, sheet)
         except Exception as e:
             print(f"Bot: Failed to write likes to Excel. Error: {e}")
     return df
 
-# for ui linking
-def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3):
+# the response in stages for streaming: the retrieved page as soon as the rows are found,
+# then the scored and personalised page ('ranked') that handle_request returns
+def request_stages(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
     try:
         
         if query.lower().strip() in ['hi', 'hello', 'hey']:
-            return {
+            yield 'ranked', {
                 "response": "Hello! How can I help you find attractions?",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
 
 
         # Handle exits
         if any(query.lower().startswith(g) for g in ['bye', 'goodbye']) or query.lower() in ['exit', 'quit']:
-            return {
+            yield 'ranked', {
                 "response": "Goodbye! Thank you for using the attractions guide! Have a great trip.",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
         
-        # Load and process data
-        df = load_data(filepath, sheet_name)
-        df = preprocess_text(df)
-        
-        # Create embeddings and search index
-        embeddings = create_embeddings(df)
-        index = create_faiss_index(embeddings)
+        # Load the processed sheet and its search index
+        sheet = corpus.get_sheet(filepath, sheet_name, build_sheet)
+        df = sheet['df']
+
+        # Misspelled words are corrected against the corpus vocabulary before any step reads the query
+        search_query = sheet['spelling'].correct(query)
         
-        # Find relevant results
-        results = find_relevant_rows(query, df, index, embeddings)
-        output = get_relevant_info(results)
+        # Find relevant results as row ids
+        ids = find_relevant_rows(search_query, df, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name, offset + limit,
+                                 sheet['grid'])
         
         # Update likes if needed
         if liked:
             df = update_likes(df, [item.lower() for item in liked], filepath, sheet_name)
+            sheet['catalog'].set_likes(df['Number of Likes'])
         
-        if output.empty:
-            return {"response": "No results found", "suggestions": []}
+        if len(ids) == 0:
+            yield 'ranked', {"response": "No results found", "suggestions": []}
+            return
         
-        # Calculate relevance scores for the requested subset
-        query_embedding = model.encode([query.lower()], normalize_embeddings=True)
-        output = output.sort_values('Number of Likes', ascending=False)
-        
-        # Apply offset and limit
-        subset = output.iloc[offset:offset+limit]
-        
-        suggestions = []
-        for _, row in subset.iterrows():
-            try:
-                # Calculate relevance score
-                attr_text = row.get('search_text', '')
-                attr_embedding = model.encode([attr_text], normalize_embeddings=True)
-                faiss_score = float(np.dot(query_embedding, attr_embedding.T)[0][0])
-                name_similarity = SequenceMatcher(None, query.lower(), row[name_col].lower()).ratio()
-                relevance_score = round((faiss_score + name_similarity) / 2, 2)
-            except Exception:
-                relevance_score = 0.0
-
-            suggestions.append({
-                "name": row[name_col].title(),
-                "description": row.get("Description", "No description available"),
-                "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                "reviews": row.get("Reviews", "Not available"),
-                "website": row.get("Website", "Not available"),
-                "likes": int(row.get("Number of Likes", 0)),
-                "category": row.get("Category", "Not specified"),
-                "relevance": relevance_score
-            })
+        # the page of retrieved rows in retrieval order, before any scoring
+        yield 'retrieved', {
+            "suggestions": [sheet['catalog'].suggestion(i, None) for i in ids[offset:offset + limit]],
+            "total_results": len(ids)
+        }
+
+        # Score every candidate once and select only the rows up to the requested page
+        scores, relevance = score_rows(sheet, ids, search_query, preference)
+        top = corpus.top_k(scores, offset + limit)[offset:]
+        suggestions = get_suggestions(sheet, ids[top], relevance[top])
+
+        # freeze the scores; the next pages are selected from them behind an opaque cursor
+        next_cursor = cursors.snapshot(sheet_name, query, ids, scores, relevance, offset + len(suggestions))
+        if session is not None:
+            sessions.remember(session, sheet_name, query, next_cursor)
         
-        return {
+        yield 'ranked', {
             "suggestions": suggestions,
-            "total_results": len(output),
+            "total_results": len(ids),
             "offset": offset,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "corrected_query": search_query if search_query != query else None
         }
         
     except Exception as e:
-        return {"error": str(e), "suggestions": []}
+        yield 'ranked', {"error": str(e), "suggestions": []}
+
+# for ui linking
+def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
+    for _, response in request_stages(city, query, liked, sheet_name, filepath, name_col, offset, limit, session, preference):
+        pass
+    return response
 
 # to run in terminal
 def search_engine(api_mode=False, city=None, query=None):
@@ -213,10 +286,8 @@ def search_engine(api_mode=False, city=None, query=None):
             continue
 
         try:
-            data = load_data(file_path, sheet_name)
-            data = preprocess_text(data)
-            embeddings = create_embeddings(data)
-            index = create_faiss_index(embeddings)
+            sheet = corpus.get_sheet(file_path, sheet_name, build_sheet)
+            data = sheet['df']
         except Exception as e:
             if api_mode:
                 return {"error": f"Failed to load {location_name} data. Error: {e}"}
@@ -243,46 +314,28 @@ def search_engine(api_mode=False, city=None, query=None):
             if any(user_query.lower().startswith(g) for g in ['bye', 'byee', 'byeee', 'goodbye', 'see ya']) or user_query.lower() in ['exit', 'quit', 'bye', 'back']:
                 if liked_attractions:
                     data = update_likes(data, liked_attractions, file_path, sheet_name)
+                    sheet['catalog'].set_likes(data['Number of Likes'])
                 if api_mode:
                     return {"response": "Goodbye! Happy travels!"}
                 print("Bot: Bye! Let me know if you want to search again later. 👋")
                 break
 
             # Process query
-            results = find_relevant_rows(user_query, data, index, embeddings)
-            output = get_relevant_info(results)
+            ids = find_relevant_rows(user_query, data, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name,
+                                     grid=sheet['grid'])
 
-            if output.empty:
+            if len(ids) == 0:
                 if api_mode:
                     return {"response": "No results found"}
                 print("Bot: I couldn't find any matches. Try using different keywords.")
                 continue
 
-            output = output.sort_values('Number of Likes', ascending=False).reset_index(drop=True)
-            query_embedding = model.encode([user_query.lower()], normalize_embeddings=True)
+            scores, relevance = score_rows(sheet, ids, user_query)
+            order = corpus.top_k(scores, len(ids))
+            ranked = ids[order]
 
             suggestions = []
-            for _, row in output.head(3).iterrows():
-                try:
-                    attr_text = row.get('search_text', '')
-                    attr_embedding = model.encode([attr_text], normalize_embeddings=True)
-                    faiss_score = np.dot(query_embedding, attr_embedding.T)[0][0]
-                    name_similarity = SequenceMatcher(None, user_query.lower(), row['Attraction Name'].lower()).ratio()
-                    relevance_score = round((faiss_score + name_similarity) / 2, 2)
-                except Exception:
-                    relevance_score = 0.0
-
-                suggestion = {
-                    "name": row['Attraction Name'].title(),
-                    "description": row.get('Description', 'No description available'),
-                    "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                    "reviews": row.get('Reviews', 'Not available'),
-                    "website": row.get('Website', 'Not available'),
-                    "likes": int(row.get('Number of Likes', 0)),
-                    "category": row.get('Category', 'Not specified'),
-                    "relevance": relevance_score
-                }
-                
+            for i, suggestion in zip(ranked[:3], get_suggestions(sheet, ranked[:3], relevance[order[:3]])):
                 if api_mode:
                     suggestions.append(suggestion)
                 else:
@@ -296,7 +349,7 @@ def search_engine(api_mode=False, city=None, query=None):
 
                     feedback = input("Bot: Like (.), Dislike (/), or skip: ").strip()
                     if feedback == '.':
-                        liked_attractions.append(row['Attraction Name'])
+                        liked_attractions.append(data['Attraction Name'].iat[i])
                         print("Bot: Thanks for the like! ❤️")
                     elif feedback == '/':
                         print("Bot: Got it 👎")
@@ -307,13 +360,14 @@ def search_engine(api_mode=False, city=None, query=None):
                 return {"suggestions": suggestions}
 
             shown = 3
-            while shown < len(output):
+            while shown < len(ranked):
                 more = input("\nBot: Would you like to see more attractions? (yes/no): ").strip().lower()
                 if more in ['yes', 'y']:
-                    for _, row in output.iloc[shown:shown+2].iterrows():
-                        print(f"\n🏝 {row['Attraction Name'].title()}")
-                        print(f"📝 {row.get('Description', 'No description available')}")
-                        print(f"📍 {row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}")
+                    for i in ranked[shown:shown+2]:
+                        record = sheet['catalog'].record(i)
+                        print(f"\n🏝 {record['name']}")
+                        print(f"📝 {record['description']}")
+                        print(f"📍 {record['address']}")
                     shown += 2
                 else:
                     print("Bot: Alright! Let me know if you want to search again. 🌟")
@@ -1,26 +1,48 @@
 import pandas as pd
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 from difflib import SequenceMatcher
+import catalog
+import corpus
+import cursors
+import encoder
+import facets
+import metrics
+import sessions
 
 # load the model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+model = encoder.get_model()
+
+# hotel sheets carry no tag columns, so the property type is read from the name
+FACET_FIELDS = {}
+FACET_KEYWORDS = {
+    'type': ('Hotel Name', ['resort', 'homestay', 'hostel', 'apartment', 'villa', 'guesthouse',
+                            'inn', 'lodge', 'chalet', 'suites', 'residence', 'motel', 'boutique'])
+}
+
+# semantic retrieval (corpus.retrieve): every row above the similarity threshold in one
+# range search, capped at max_results, so later pages come from the same search
+SEMANTIC_SEARCH = {'mode': 'range', 'threshold': 0.3, 'k': 10, 'max_results': 100}
+
+# display-only columns, dropped from the served frame once the catalog holds them
+DISPLAY_COLUMNS = ['Description', 'Reviews', 'Website', 'Country']
 
 # step 1
+@metrics.timed('load_data')
 def load_data(filepath, sheet_name):
     try:
-        return pd.read_excel(filepath, sheet_name=sheet_name)
+        return corpus.read_sheet(filepath, sheet_name)
     except Exception as e:
         print(f"Error loading data: {str(e)}")
         raise
 
 # step 2
+@metrics.timed('preprocess_text')
 def preprocess_text(df):
     text_cols = ['Hotel Name', 'Description', 'Category', 'Address']
-    for col in text_cols:
-        df[col] = df[col].fillna('').astype(str).str.strip()
-    df['search_text'] = df[text_cols].agg(' | '.join, axis=1).str.lower()
+    df = corpus.clean_columns(df, text_cols)
+    df['search_text'] = corpus.join_columns(df, text_cols, ' | ').str.lower()
+    df['Hotel Name'] = df['Hotel Name'].str.lower()
     
     if 'Number of Likes' not in df.columns:
         df['Number of Likes'] = 0
@@ -28,66 +50,126 @@ def preprocess_text(df):
     return df
 
 # step 3
+@metrics.timed('create_embeddings')
 def create_embeddings(df):
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    return model.encode(df['search_text'].tolist(), convert_to_tensor=True)
+    return model.encode(df['search_text'].tolist(), convert_to_numpy=True, batch_size=encoder.BATCH_SIZE)
 
 # step 4
-def create_faiss_index(embeddings):
-    embeddings_np = embeddings.cpu().numpy().astype('float32')
+@metrics.timed('create_faiss_index')
+def create_faiss_index(embeddings, index=None):
+    embeddings_np = np.array(embeddings, dtype='float32')
     faiss.normalize_L2(embeddings_np)
-    index = faiss.IndexFlatIP(embeddings_np.shape[1])
+    if index is None:
+        index = faiss.IndexFlatIP(embeddings_np.shape[1])
     index.add(embeddings_np)
     return index
 
 # step 5
-def find_relevant_rows(query, df, index, embeddings):
+@metrics.timed('find_relevant_rows')
+def find_relevant_rows(query, df, index, embeddings, facet_index, sheet_name, needed=0, grid=None):
     query_lower = query.lower().strip()
+    # lower-cased once at build time; the same array as sheet['names']
+    names = df['Hotel Name'].to_numpy()
     
     # 1. Exact name matches
-    exact_matches = df[df['Hotel Name'].str.lower() == query_lower]
-    if not exact_matches.empty:
+    exact_matches = np.flatnonzero(names == query_lower)
+    if len(exact_matches) > 0:
         return exact_matches
     
-    # 2. Address matches
-    address_matches = df[df['Address'].str.lower().str.contains(query_lower)]
-    if not address_matches.empty:
-        return address_matches.head(3)
+    # 2. Hotels near a place the query names ("near klcc", "within 2 km of jonker street"),
+    # narrowed by any property type or area tag it also names
+    near = corpus.nearby(query_lower, grid)
+    if near is not None:
+        matches = facets.match_query(query_lower, facet_index)
+        if matches:
+            mask = facets.filter_mask(facet_index, sheet_name, matches, len(df))
+            within = np.zeros(len(df), dtype=bool)
+            within[near] = True
+            if (mask & within).any():
+                tag_matches, _ = corpus.search(index, model.encode([query_lower], normalize_embeddings=True)[0], SEMANTIC_SEARCH['max_results'], mask & within)
+                return tag_matches
+        return near
+
+    # 3. Address matches
+    address_matches = np.flatnonzero(df['Address'].str.lower().str.contains(query_lower))
+    if len(address_matches) > 0:
+        return address_matches[:3]
     
-    # 3. Partial name matches
-    partial_matches = df[df['Hotel Name'].str.lower().str.contains(query_lower)]
-    if not partial_matches.empty:
-        return partial_matches.head(3)
+    # 4. Partial name matches
+    partial_matches = np.flatnonzero(df['Hotel Name'].str.contains(query_lower))
+    if len(partial_matches) > 0:
+        return partial_matches[:3]
     
-    # 4. Semantic search
-    model = SentenceTransformer('all-MiniLM-L6-v2')
-    query_embedding = model.encode([query_lower])
-    distances, indices = index.search(query_embedding, k=5)
-    mask = distances[0] > 0.3
-    if np.any(mask):
-        return df.iloc[indices[0][mask]]
+    # 5. Property type and area tags from the facet dictionary
+    matches = facets.match_query(query_lower, facet_index)
+    if matches:
+        mask = facets.filter_mask(facet_index, sheet_name, matches, len(df))
+        if mask.any():
+            # the filter is pushed into the semantic search, which orders the tagged rows
+            tag_matches, _ = corpus.search(index, model.encode([query_lower], normalize_embeddings=True)[0], SEMANTIC_SEARCH['max_results'], mask)
+            return tag_matches
+
+    # 6. Semantic search
+    query_embedding = model.encode([query_lower], normalize_embeddings=True)
+    semantic_matches, _ = corpus.retrieve(index, query_embedding[0], SEMANTIC_SEARCH, needed)
+    if len(semantic_matches) > 0:
+        return semantic_matches
     
-    # 5. Fuzzy matching
-    df['name_similarity'] = df['Hotel Name'].str.lower().apply(
-        lambda x: SequenceMatcher(None, query_lower, x).ratio()
-    )
-    return df.nlargest(3, 'name_similarity')
+    # 7. Fuzzy matching
+    name_similarity = np.array([SequenceMatcher(None, query_lower, x).ratio() for x in names])
+    return np.argsort(-name_similarity, kind='stable')[:3]
 
 # step 6
 def get_relevant_info(df):
     required_cols = ['Hotel Name', 'Address', 'State', 'Country', 
-                     'Description', 'Category', 'Reviews', 'Website', 'Number of Likes']
+                     'Description', 'Category', 'Reviews', 'Website']
     for col in required_cols:
         if col not in df.columns:
             df[col] = ''
-    info = df[required_cols].copy()
-    info['Hotel Name'] = info['Hotel Name'].str.title()
-    info['Address'] = info['Address'].replace('', 'Address not available')
-    return info
+    address = df['Address'].replace('', 'Address not available')
+    address = corpus.join_columns(pd.concat([address, df[['State', 'Country']]], axis=1).astype(str),
+                                  ['Address', 'State', 'Country'], ', ').str.strip(', ')
+
+    # static display fields of every row, packed into the catalog at build time
+    return pd.DataFrame({
+        "name": df['Hotel Name'].str.title(),
+        "description": df['Description'],
+        "address": address,
+        "reviews": df['Reviews'],
+        "website": df['Website'],
+        "category": df['Category']
+    })
+
+# score every candidate once: the blended ranking score and the relevance shown
+@metrics.timed('scoring')
+def score_rows(sheet, ids, query, preference=None):
+    query_embedding = model.encode([query.lower()], normalize_embeddings=True)[0]
+    return corpus.blend_scores(ids, query.lower(), query_embedding, sheet['embeddings'], sheet['names'], sheet['catalog'].likes,
+                               preference)
+
+# fill in the per-query fields for the rows on one page
+def get_suggestions(sheet, ids, relevance):
+    return [sheet['catalog'].suggestion(i, float(score)) for i, score in zip(ids, relevance)]
+
+# steps 1-4 plus facets, run once per sheet and cached by corpus
+def build_sheet(filepath, sheet_name):
+    df = preprocess_text(load_data(filepath, sheet_name))
+    df['Number of Likes'] = pd.to_numeric(df['Number of Likes'], errors='coerce').fillna(0).astype(int)
+    index = corpus.load_index(filepath, sheet_name, df, create_embeddings, create_faiss_index)
+    return {
+        'embeddings': corpus.index_vectors(index),
+        'index': index,
+        'facets': corpus.get_facets(filepath, FACET_FIELDS, FACET_KEYWORDS),
+        'grid': corpus.build_grid(df),
+        'spelling': corpus.get_spelling(),
+        'catalog': catalog.Catalog(get_relevant_info(df), df['Number of Likes']),
+        # lower-cased names for name similarity, so scoring touches only the candidate rows
+        'names': df['Hotel Name'].to_numpy(),
+        'df': df.drop(columns=DISPLAY_COLUMNS, errors='ignore')
+    }
 
 # step 7
 def update_likes(df, liked_hotels, file_path=None, sheet_name=None):
-    df['Hotel Name'] = df['Hotel Name'].astype(str).str.lower()
     df['Number of Likes'] = pd.to_numeric(df['Number of Likes'], errors='coerce').fillna(0).astype(int)
 
     for hotel in liked_hotels:
@@ -97,100 +179,90 @@ def update_likes(df, liked_hotels, file_path=None, sheet_name=None):
 
     if file_path and sheet_name:
         try:
-            with pd.ExcelFile(file_path, engine='openpyxl') as reader:
-                sheets_dict = {sheet: pd.read_excel(reader, sheet_name=sheet) for sheet in reader.sheet_names}
-
-            sheets_dict[sheet_name] = df
-
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                for sheet_name, sheet_data in sheets_dict.items():
-                    sheet_data.to_excel(writer, sheet_name=sheet_name, index=False)
-
+            corpus.flush_likes(df, file_path, sheet_name)
         except Exception as e:
             print(f"Bot: Failed to write likes to Excel. Error: {e}")
 
     return df
 
-# for ui linking
-def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3):
+# the response in stages for streaming: the retrieved page as soon as the rows are found,
+# then the scored and personalised page ('ranked') that handle_request returns
+def request_stages(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
     try:
         if query.lower().strip() in ['hi', 'hello', 'hey']:
-            return {
+            yield 'ranked', {
                 "response": "Hello! How can I help you find hotels?",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
 
         # Handle exits
         if any(query.lower().startswith(g) for g in ['bye', 'goodbye']) or query.lower() in ['exit', 'quit']:
-            return {
+            yield 'ranked', {
                 "response": "Goodbye! Hope you enjoy your trip!",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
         
-        # Load and process data
-        df = load_data(filepath, sheet_name)
-        df = preprocess_text(df)
-        
-        # Create embeddings and search index
-        embeddings = create_embeddings(df)
-        index = create_faiss_index(embeddings)
+        # Load the processed sheet and its search index
+        sheet = corpus.get_sheet(filepath, sheet_name, build_sheet)
+        df = sheet['df']
+
+        # Misspelled words are corrected against the corpus vocabulary before any step reads the query
+        search_query = sheet['spelling'].correct(query)
         
-        # Find relevant results
-        results = find_relevant_rows(query, df, index, embeddings)
-        output = get_relevant_info(results)
+        # Find relevant results as row ids
+        ids = find_relevant_rows(search_query, df, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name, offset + limit,
+                                 sheet['grid'])
         
         # Update likes if needed
         if liked:
             df = update_likes(df, liked, filepath, sheet_name)
+            sheet['catalog'].set_likes(df['Number of Likes'])
         
-        if output.empty:
-            return {"response": "No results found", "suggestions": []}
+        if len(ids) == 0:
+            yield 'ranked', {"response": "No results found", "suggestions": []}
+            return
         
-        # Calculate relevance scores
-        query_embedding = model.encode([query.lower()], normalize_embeddings=True)
-        output = output.sort_values('Number of Likes', ascending=False)
+        # the page of retrieved rows in retrieval order, before any scoring
+        yield 'retrieved', {
+            "suggestions": [sheet['catalog'].suggestion(i, None) for i in ids[offset:offset + limit]],
+            "total_results": len(ids)
+        }
 
-        # Apply offset and limit
-        subset = output.iloc[offset:offset+limit]
-        
-        suggestions = []
-        for _, row in subset.iterrows():
-            try:
-                # Calculate relevance score
-                hotel_text = row.get('search_text', '')
-                hotel_embedding = model.encode([hotel_text], normalize_embeddings=True)
-                faiss_score = float(np.dot(query_embedding, hotel_embedding.T)[0][0])
-                name_similarity = SequenceMatcher(None, query.lower(), row[name_col].lower()).ratio()
-                relevance_score = round((faiss_score + name_similarity) / 2, 2)
-            except Exception:
-                relevance_score = 0.0
-
-            suggestions.append({
-                "name": row[name_col].title(),
-                "description": row.get("Description", "No description available"),
-                "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                "reviews": row.get("Reviews", "Not available"),
-                "website": row.get("Website", "Not available"),
-                "likes": int(row.get("Number of Likes", 0)),
-                "category": row.get("Category", "Not specified"),
-                "relevance": relevance_score
-            })
+        # Score every candidate once and select only the rows up to the requested page
+        scores, relevance = score_rows(sheet, ids, search_query, preference)
+        top = corpus.top_k(scores, offset + limit)[offset:]
+        suggestions = get_suggestions(sheet, ids[top], relevance[top])
+
+        # freeze the scores; the next pages are selected from them behind an opaque cursor
+        next_cursor = cursors.snapshot(sheet_name, query, ids, scores, relevance, offset + len(suggestions))
+        if session is not None:
+            sessions.remember(session, sheet_name, query, next_cursor)
         
-        return {
+        yield 'ranked', {
             "suggestions": suggestions,
-            "total_results": len(output),
+            "total_results": len(ids),
             "offset": offset,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "corrected_query": search_query if search_query != query else None
         }
         
     except Exception as e:
-        return {"error": str(e), "suggestions": []}
+        yield 'ranked', {"error": str(e), "suggestions": []}
+
+# for ui linking
+def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
+    for _, response in request_stages(city, query, liked, sheet_name, filepath, name_col, offset, limit, session, preference):
+        pass
+    return response
 
 # to run in terminal
 def search_engine(api_mode=False, city=None, query=None, liked=None):
@@ -238,10 +310,8 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
             continue
 
         try:
-            data = load_data(file_path, sheet_name)
-            data = preprocess_text(data)
-            embeddings = create_embeddings(data)
-            index = create_faiss_index(embeddings)
+            sheet = corpus.get_sheet(file_path, sheet_name, build_sheet)
+            data = sheet['df']
         except Exception as e:
             if api_mode:
                 return {"error": f"Failed to load data. Error: {e}"}
@@ -268,46 +338,28 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
             if any(user_query.lower().startswith(g) for g in ['bye', 'byee', 'byeee', 'goodbye', 'see ya']) or user_query.lower() in ['exit', 'quit', 'bye', 'back']:
                 if liked_hotels:
                     data = update_likes(data, liked_hotels, file_path, sheet_name)
+                    sheet['catalog'].set_likes(data['Number of Likes'])
                 if api_mode:
                     return {"response": "Goodbye! Happy travels!"}
                 print("Bot: Bye! Let me know if you want to search again later. 👋")
                 break
 
             # Process query
-            results = find_relevant_rows(user_query, data, index, embeddings)
-            output = get_relevant_info(results)
+            ids = find_relevant_rows(user_query, data, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name,
+                                     grid=sheet['grid'])
 
-            if output.empty:
+            if len(ids) == 0:
                 if api_mode:
                     return {"response": "No results found"}
                 print("Bot: No matches found. Try different keywords.")
                 continue
 
-            output = output.sort_values('Number of Likes', ascending=False).reset_index(drop=True)
-            query_embedding = model.encode([user_query.lower()], normalize_embeddings=True)
+            scores, relevance = score_rows(sheet, ids, user_query)
+            order = corpus.top_k(scores, len(ids))
+            ranked = ids[order]
 
             suggestions = []
-            for _, row in output.head(3).iterrows():
-                try:
-                    hotel_text = row.get('search_text', '')
-                    hotel_embedding = model.encode([hotel_text], normalize_embeddings=True)
-                    faiss_score = np.dot(query_embedding, hotel_embedding.T)[0][0]
-                    name_similarity = SequenceMatcher(None, user_query.lower(), row['Hotel Name'].lower()).ratio()
-                    relevance_score = round((faiss_score + name_similarity) / 2, 2)
-                except Exception:
-                    relevance_score = 0.0
-
-                suggestion = {
-                    "name": row['Hotel Name'].title(),
-                    "description": row.get('Description', 'No description available'),
-                    "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                    "reviews": row.get('Reviews', 'Not available'),
-                    "website": row.get('Website', 'Not available'),
-                    "likes": int(row.get('Number of Likes', 0)),
-                    "category": row.get('Category', 'Not specified'),
-                    "relevance": relevance_score
-                }
-                
+            for i, suggestion in zip(ranked[:3], get_suggestions(sheet, ranked[:3], relevance[order[:3]])):
                 if api_mode:
                     suggestions.append(suggestion)
                 else:
@@ -321,7 +373,7 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
 
                     feedback = input("Bot: Like (.), Dislike (/), or skip: ").strip()
                     if feedback == '.':
-                        liked_hotels.append(row['Hotel Name'])
+                        liked_hotels.append(data['Hotel Name'].iat[i])
                         print("Bot: Thanks for the like! ❤️")
                     elif feedback == '/':
                         print("Bot: Got it 👎")
@@ -332,13 +384,14 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
                 return {"suggestions": suggestions}
 
             shown = 3
-            while shown < len(output):
+            while shown < len(ranked):
                 more = input("\nBot: Would you like to see more hotels? (yes/no): ").strip().lower()
                 if more in ['yes', 'y']:
-                    for _, row in output.iloc[shown:shown+2].iterrows():
-                        print(f"\n🏨 {row['Hotel Name'].title()}")
-                        print(f"📝 {row.get('Description', 'No description available')}")
-                        print(f"📍 {row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}")
+                    for i in ranked[shown:shown+2]:
+                        record = sheet['catalog'].record(i)
+                        print(f"\n🏨 {record['name']}")
+                        print(f"📝 {record['description']}")
+                        print(f"📍 {record['address']}")
                     shown += 2
                 else:
                     print("Bot: Alright! Let me know if you want to search again. 🌟")
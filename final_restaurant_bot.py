@@ -1,95 +1,99 @@
 import pandas as pd
-from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 from difflib import SequenceMatcher
 import openpyxl
+import catalog
+import corpus
+import cursors
+import encoder
+import facets
+import metrics
+import sessions
 
 # load model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+model = encoder.get_model()
+
+# tag columns scanned into the facet dictionary at build time
+FACET_FIELDS = {'cuisine': 'Cuisines', 'diet': 'Dietary Restrictions'}
+
+# semantic retrieval (corpus.retrieve): every row above the similarity threshold in one
+# range search, capped at max_results, so later pages come from the same search
+SEMANTIC_SEARCH = {'mode': 'range', 'threshold': 0.3, 'k': 10, 'max_results': 100}
+
+# display-only columns, dropped from the served frame once the catalog holds them
+DISPLAY_COLUMNS = ['Description', 'Reviews', 'Website', 'Country', 'Cuisines', 'Dietary Info']
 
 # step 1
+@metrics.timed('load_data')
 def load_data(filepath, sheet_name):
-    df = pd.read_excel(filepath, sheet_name=sheet_name)
+    df = corpus.read_sheet(filepath, sheet_name)
     for col in df.select_dtypes(include=['int64', 'float64']):
         df[col] = pd.to_numeric(df[col], downcast='integer' if df[col].dtype == 'int64' else 'float')
     return df
 
 # step 2
+@metrics.timed('preprocess_text')
 def preprocess_text(df):
-    cuisine_cols = [col for col in df.columns if col.lower().startswith('cuisines')]
-    diet_cols = [col for col in df.columns if col.lower().startswith('dietary restrictions')]
+    cuisine_cols = facets.tag_columns(df, 'Cuisines')
+    diet_cols = facets.tag_columns(df, 'Dietary Restrictions')
     text_cols = ['Restaurant Name', 'Description', 'Category'] + cuisine_cols + diet_cols
 
-    for col in text_cols:
-        df[col] = df[col].fillna('').astype(str).str.strip()
-
-    df['search_text'] = df[text_cols].agg(' | '.join, axis=1).str.lower()
+    df = corpus.clean_columns(df, text_cols)
+    df['search_text'] = corpus.join_columns(df, text_cols, ' | ').str.lower()
     df['Restaurant Name'] = df['Restaurant Name'].str.lower()
+
+    # display fields are derived once here rather than on every request
+    df['Cuisines'] = corpus.join_nonempty(df, cuisine_cols, empty='Not specified')
+    df['Dietary Info'] = corpus.join_nonempty(df, diet_cols, empty='Not specified')
     return df, cuisine_cols, diet_cols
 
 # step 3
+@metrics.timed('create_embeddings')
 def create_embeddings(df):
-    return model.encode(df['search_text'].tolist(), convert_to_tensor=True, show_progress_bar=True)
+    return model.encode(df['search_text'].tolist(), convert_to_numpy=True, batch_size=encoder.BATCH_SIZE, show_progress_bar=True)
 
 # step 4
-def create_faiss_index(embeddings):
-    embeddings_np = embeddings.cpu().numpy().astype('float32')
+@metrics.timed('create_faiss_index')
+def create_faiss_index(embeddings, index=None):
+    embeddings_np = np.array(embeddings, dtype='float32')
     faiss.normalize_L2(embeddings_np)
-    index = faiss.IndexFlatIP(embeddings_np.shape[1])
+    if index is None:
+        index = faiss.IndexFlatIP(embeddings_np.shape[1])
     index.add(embeddings_np)
     return index
 
 # step 5
-def find_relevant_rows(query, df, index, embeddings, cuisine_cols, diet_cols):
+@metrics.timed('find_relevant_rows')
+def find_relevant_rows(query, df, index, embeddings, facet_index, sheet_name, needed=0, grid=None):
     query_lower = query.lower().strip()
-    df = df.copy()
+    names = df['Restaurant Name'].to_numpy()
 
     # First check for exact name matches
-    exact_matches = df[df['Restaurant Name'] == query_lower]
-    if not exact_matches.empty:
+    exact_matches = np.flatnonzero(names == query_lower)
+    if len(exact_matches) > 0:
         return exact_matches
 
-    # Handle negative cuisine conditions (like "non-chinese")
-    negative_cuisine = None
-    if 'non-' in query_lower:
-        for cuisine in ['chinese', 'indian', 'malay', 'western', 'arabic', 'japanese', 'thai']:
-            if f'non-{cuisine}' in query_lower:
-                negative_cuisine = cuisine
-                break
-
-    # Handle dietary restrictions
-    diet_keywords = {'vegetarian', 'vegan', 'halal', 'gluten-free', 'kosher', 'vegetarian-friendly'}
-    found_diet = next((diet for diet in diet_keywords if diet in query_lower), None)
-
-    # Handle cuisine types
-    cuisine_keywords = {
-        'pakistani', 'indian', 'chinese', 'italian', 'thai',
-        'japanese', 'mexican', 'western', 'arabic', 'malay',
-        'spanish', 'european', 'american', 'asian', 'german', 'sri lankan'
-    }
-    found_cuisine = next((cuisine for cuisine in cuisine_keywords if cuisine in query_lower), None)
-
-    # Apply filters
-    filtered_df = df.copy()
-    
-    # If we found a dietary restriction, filter by it
-    if found_diet:
-        filtered_df = filtered_df[filtered_df[diet_cols].apply(
-            lambda row: any(found_diet in str(cell).lower() for cell in row), axis=1)]
-    
-    # If we found a cuisine to exclude, filter it out
-    if negative_cuisine:
-        filtered_df = filtered_df[~filtered_df[cuisine_cols].apply(
-            lambda row: any(negative_cuisine in str(cell).lower() for cell in row), axis=1)]
-    # Otherwise if we found a positive cuisine filter, apply it
-    elif found_cuisine:
-        filtered_df = filtered_df[filtered_df[cuisine_cols].apply(
-            lambda row: any(found_cuisine in str(cell).lower() for cell in row), axis=1)]
-
-    # If we have any filters applied and got results, return them
-    if (found_diet or negative_cuisine or found_cuisine) and not filtered_df.empty:
-        return filtered_df
+    # A place after "near", "in" or "within 2 km of" is a radius around its gazetteer point,
+    # answered by the sheet's grid index
+    near = corpus.nearby(query_lower, grid)
+
+    # Cuisine, dietary and area tags (including "non-chinese") come from the facet dictionary
+    matches = facets.match_query(query_lower, facet_index)
+    if matches:
+        mask = facets.filter_mask(facet_index, sheet_name, matches, len(df))
+        if near is not None:
+            # only the tagged rows within the radius
+            within = np.zeros(len(df), dtype=bool)
+            within[near] = True
+            mask &= within
+        if mask.any():
+            # the filter is pushed into the semantic search, which orders the filtered rows
+            filtered, _ = corpus.search(index, model.encode([query_lower], normalize_embeddings=True)[0], SEMANTIC_SEARCH['max_results'], mask)
+            return filtered
+
+    if near is not None:
+        return near
 
     # Fall back to other search methods if no filters matched
     location_phrases = ['restaurants in', 'restaurants near', 'places to eat in',
@@ -97,49 +101,69 @@ def find_relevant_rows(query, df, index, embeddings, cuisine_cols, diet_cols):
     found_location = next((query_lower.split(phrase)[-1].strip()
                          for phrase in location_phrases if phrase in query_lower), None)
     if found_location:
-        location_matches = df[df['Address'].str.contains(found_location, case=False, na=False) |
-                           df['State'].str.contains(found_location, case=False, na=False)]
-        if not location_matches.empty:
+        location_matches = np.flatnonzero(df['Address'].str.contains(found_location, case=False, na=False) |
+                                          df['State'].str.contains(found_location, case=False, na=False))
+        if len(location_matches) > 0:
             return location_matches
 
-    category_matches = df[df['Category'].str.contains(query_lower, case=False, na=False)]
-    if not category_matches.empty:
+    category_matches = np.flatnonzero(df['Category'].str.contains(query_lower, case=False, na=False))
+    if len(category_matches) > 0:
         return category_matches
 
     # Fall back to semantic search if no direct matches
-    query_embedding = model.encode([query_lower])
-    distances, indices = index.search(query_embedding, k=5)
-    mask = distances[0] > 0.3
-    filtered_indices = indices[0][mask]
-
-    if len(filtered_indices) > 0:
-        results = df.iloc[filtered_indices].copy()
-        results['name_similarity'] = results['Restaurant Name'].apply(
-            lambda x: SequenceMatcher(None, query_lower, x).ratio())
-        results['query_embedding'] = [query_embedding[0]] * len(results)
-        return results.sort_values('name_similarity', ascending=False)
+    query_embedding = model.encode([query_lower], normalize_embeddings=True)
+    filtered_indices, _ = corpus.retrieve(index, query_embedding[0], SEMANTIC_SEARCH, needed)
 
-    return pd.DataFrame()
+    # Order the semantic hits by how closely their names match the query
+    name_similarity = np.array([SequenceMatcher(None, query_lower, names[i]).ratio() for i in filtered_indices])
+    return filtered_indices[np.argsort(-name_similarity, kind='stable')]
 
 # step 6
-def get_relevant_info(df, cuisine_cols, diet_cols):
-    info = df.copy()
-
-    info['Cuisines'] = info[cuisine_cols].apply(
-        lambda row: ', '.join(filter(lambda x: x not in ['', 'nan'], row.astype(str))), axis=1)
-
-    info['Dietary Info'] = info[diet_cols].apply(
-        lambda row: ', '.join(filter(lambda x: x not in ['', 'nan'], row.astype(str))), axis=1)
-
-    display_cols = ['Restaurant Name', 'Address', 'State', 'Country', 
-                    'Description', 'Category', 'Reviews', 
-                    'Website', 'Cuisines', 'Dietary Info', 'Number of Likes', 'search_text']
-
-    for col in display_cols:
-        if col in info.columns:
-            info[col] = info[col].replace(['', 'nan'], 'Not specified')
-
-    return info[[col for col in display_cols if col in info.columns]]
+def get_relevant_info(df):
+    display = df[['Address', 'State', 'Country', 'Description', 'Reviews', 'Website',
+                  'Cuisines', 'Dietary Info']].replace(['', 'nan'], 'Not specified')
+    address = corpus.join_columns(display.astype(str), ['Address', 'State', 'Country'], ', ').str.strip(', ')
+
+    # static display fields of every row, packed into the catalog at build time
+    return pd.DataFrame({
+        "name": df['Restaurant Name'].str.title(),
+        "description": display['Description'],
+        "address": address,
+        "reviews": display['Reviews'],
+        "website": display['Website'],
+        "cuisines": display['Cuisines'],
+        "dietary": display['Dietary Info']
+    })
+
+# score every candidate once: the blended ranking score and the relevance shown
+@metrics.timed('scoring')
+def score_rows(sheet, ids, query, preference=None):
+    query_embedding = model.encode([query.lower()], normalize_embeddings=True)[0]
+    names = sheet['df']['Restaurant Name'].to_numpy()
+    return corpus.blend_scores(ids, query.lower(), query_embedding, sheet['embeddings'], names, sheet['catalog'].likes,
+                               preference)
+
+# fill in the per-query fields for the rows on one page
+def get_suggestions(sheet, ids, relevance):
+    return [sheet['catalog'].suggestion(i, float(score)) for i, score in zip(ids, relevance)]
+
+# steps 1-4 plus facets, run once per sheet and cached by corpus
+def build_sheet(filepath, sheet_name):
+    df = load_data(filepath, sheet_name)
+    df, cuisine_cols, diet_cols = preprocess_text(df)
+    df['Number of Likes'] = pd.to_numeric(df['Number of Likes'], errors='coerce').fillna(0).astype(int)
+    index = corpus.load_index(filepath, sheet_name, df, create_embeddings, create_faiss_index)
+    return {
+        'cuisine_cols': cuisine_cols,
+        'diet_cols': diet_cols,
+        'embeddings': corpus.index_vectors(index),
+        'index': index,
+        'facets': corpus.get_facets(filepath, FACET_FIELDS),
+        'grid': corpus.build_grid(df),
+        'spelling': corpus.get_spelling(),
+        'catalog': catalog.Catalog(get_relevant_info(df), df['Number of Likes'], df[cuisine_cols + diet_cols]),
+        'df': df.drop(columns=DISPLAY_COLUMNS, errors='ignore')
+    }
 
 # step 7
 def update_likes(df, liked_restaurants, file_path=None, sheet_name=None):
@@ -149,106 +173,90 @@ def update_likes(df, liked_restaurants, file_path=None, sheet_name=None):
 
     if liked_restaurants and file_path and sheet_name:
         try:
-            with pd.ExcelFile(file_path, engine='openpyxl') as reader:
-                sheets_dict = {sheet: pd.read_excel(reader, sheet_name=sheet) for sheet in reader.sheet_names}
-            sheets_dict[sheet_name] = df
-
-            with pd.ExcelWriter(file_path, engine='openpyxl') as writer:
-                for sheet, sheet_data in sheets_dict.items():
-                    sheet_data.to_excel(writer, sheet_name=sheet, index=False)
-
+            corpus.flush_likes(df, file_path, sheet_name)
         except Exception as e:
             print(f"Bot: Failed to write likes to Excel. Error: {e}")
 
     return df
 
-# for ui linking
-def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3):
+# the response in stages for streaming: the retrieved page as soon as the rows are found,
+# then the scored and personalised page ('ranked') that handle_request returns
+def request_stages(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
     try:
         if query.lower().strip() in ['hi', 'hello', 'hey']:
-            return {
+            yield 'ranked', {
                 "response": "Hello! How can I help you find restaurants?",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
 
         # Handle exits
         if any(query.lower().startswith(g) for g in ['bye', 'goodbye']) or query.lower() in ['exit', 'quit']:
-            return {
+            yield 'ranked', {
                 "response": "Goodbye! Enjoy your food adventure!",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
         
-        # Load and process data
-        df = load_data(filepath, sheet_name)
-        df, cuisine_cols, diet_cols = preprocess_text(df)
-        
-        # Create embeddings and search index
-        embeddings = create_embeddings(df)
-        index = create_faiss_index(embeddings)
+        # Load the processed sheet and its search index
+        sheet = corpus.get_sheet(filepath, sheet_name, build_sheet)
+        df = sheet['df']
+
+        # Misspelled words are corrected against the corpus vocabulary before any step reads the query
+        search_query = sheet['spelling'].correct(query)
         
-        # Find relevant results
-        results = find_relevant_rows(query, df, index, embeddings, cuisine_cols, diet_cols)
-        output = get_relevant_info(results, cuisine_cols, diet_cols)
+        # Find relevant results as row ids
+        ids = find_relevant_rows(search_query, df, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name, offset + limit,
+                                 sheet['grid'])
         
         # Update likes if needed
         if liked:
             df = update_likes(df, liked, filepath, sheet_name)
+            sheet['catalog'].set_likes(df['Number of Likes'])
         
-        if output.empty:
-            return {
+        if len(ids) == 0:
+            yield 'ranked', {
                 "response": "No results found",
                 "suggestions": [],
                 "total_results": 0,
                 "offset": offset,
                 "limit": limit
             }
+            return
         
-        # Calculate relevance scores
-        query_embedding = model.encode([query.lower()], normalize_embeddings=True)
-        output = output.sort_values('Number of Likes', ascending=False)
-        
-        # Apply offset and limit
-        subset = output.iloc[offset:offset+limit]
-        
-        suggestions = []
-        for _, row in subset.iterrows():
-            try:
-                # Calculate relevance score
-                rest_text = row.get('search_text', '')
-                rest_embedding = model.encode([rest_text], normalize_embeddings=True)
-                faiss_score = float(np.dot(query_embedding, rest_embedding.T)[0][0])
-                name_similarity = SequenceMatcher(None, query.lower(), row[name_col].lower()).ratio()
-                relevance_score = round((faiss_score + name_similarity) / 2, 2)
-            except Exception:
-                relevance_score = 0.0
-
-            suggestions.append({
-                "name": row[name_col].title(),
-                "description": row.get("Description", "No description available"),
-                "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                "reviews": row.get("Reviews", "Not available"),
-                "website": row.get("Website", "Not available"),
-                "cuisines": row.get("Cuisines", "Not specified"),
-                "dietary": row.get("Dietary Info", "Not specified"),
-                "likes": int(row.get("Number of Likes", 0)),
-                "relevance": relevance_score
-            })
+        # the page of retrieved rows in retrieval order, before any scoring
+        yield 'retrieved', {
+            "suggestions": [sheet['catalog'].suggestion(i, None) for i in ids[offset:offset + limit]],
+            "total_results": len(ids)
+        }
+
+        # Score every candidate once and select only the rows up to the requested page
+        scores, relevance = score_rows(sheet, ids, search_query, preference)
+        top = corpus.top_k(scores, offset + limit)[offset:]
+        suggestions = get_suggestions(sheet, ids[top], relevance[top])
+
+        # freeze the scores; the next pages are selected from them behind an opaque cursor
+        next_cursor = cursors.snapshot(sheet_name, query, ids, scores, relevance, offset + len(suggestions))
+        if session is not None:
+            sessions.remember(session, sheet_name, query, next_cursor)
         
-        return {
+        yield 'ranked', {
             "suggestions": suggestions,
-            "total_results": len(output),
+            "total_results": len(ids),
             "offset": offset,
-            "limit": limit
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "corrected_query": search_query if search_query != query else None
         }
         
     except Exception as e:
-        return {
+        yield 'ranked', {
             "error": str(e),
             "suggestions": [],
             "total_results": 0,
@@ -256,6 +264,12 @@ def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0,
             "limit": limit
         }
 
+# for ui linking
+def handle_request(city, query, liked, sheet_name, filepath, name_col, offset=0, limit=3, session=None, preference=None):
+    for _, response in request_stages(city, query, liked, sheet_name, filepath, name_col, offset, limit, session, preference):
+        pass
+    return response
+
 # to run in terminal
 def search_engine(api_mode=False, city=None, query=None, liked=None):
     file_path = "final_restaurants.xlsx"
@@ -302,10 +316,8 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
             continue
 
         try:
-            data = load_data(file_path, sheet_name)
-            data, cuisine_cols, diet_cols = preprocess_text(data)
-            embeddings = create_embeddings(data)
-            index = create_faiss_index(embeddings)
+            sheet = corpus.get_sheet(file_path, sheet_name, build_sheet)
+            data = sheet['df']
         except Exception as e:
             if api_mode:
                 return {"error": f"Failed to load data. Error: {e}"}
@@ -332,47 +344,28 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
             if any(user_query.lower().startswith(g) for g in ['bye', 'byee', 'byeee', 'goodbye', 'see ya']) or user_query.lower() in ['exit', 'quit', 'bye', 'back']:
                 if liked_restaurants:
                     data = update_likes(data, liked_restaurants, file_path, sheet_name)
+                    sheet['catalog'].set_likes(data['Number of Likes'])
                 if api_mode:
                     return {"response": "Goodbye! Bon appétit!"}
                 print("Bot: Bye! Let me know if you want to search again later. 👋")
                 break
 
             # Process query
-            results = find_relevant_rows(user_query, data, index, embeddings, cuisine_cols, diet_cols)
-            output = get_relevant_info(results, cuisine_cols, diet_cols)
+            ids = find_relevant_rows(user_query, data, sheet['index'], sheet['embeddings'], sheet['facets'], sheet_name,
+                                     grid=sheet['grid'])
 
-            if output.empty:
+            if len(ids) == 0:
                 if api_mode:
                     return {"response": "No results found"}
                 print("Bot: No matches found. Try different keywords.")
                 continue
 
-            output = output.sort_values('Number of Likes', ascending=False).reset_index(drop=True)
-            query_embedding = model.encode([user_query.lower()], normalize_embeddings=True)
+            scores, relevance = score_rows(sheet, ids, user_query)
+            order = corpus.top_k(scores, len(ids))
+            ranked = ids[order]
 
             suggestions = []
-            for _, row in output.head(3).iterrows():
-                try:
-                    rest_text = row.get('search_text', '')
-                    rest_embedding = model.encode([rest_text], normalize_embeddings=True)
-                    faiss_score = np.dot(query_embedding, rest_embedding.T)[0][0]
-                    name_similarity = SequenceMatcher(None, user_query.lower(), row['Restaurant Name'].lower()).ratio()
-                    relevance_score = round((faiss_score + name_similarity) / 2, 2)
-                except Exception:
-                    relevance_score = 0.0
-
-                suggestion = {
-                    "name": row['Restaurant Name'].title(),
-                    "description": row.get('Description', 'No description available'),
-                    "address": f"{row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}".strip(', '),
-                    "reviews": row.get('Reviews', 'Not available'),
-                    "website": row.get('Website', 'Not available'),
-                    "cuisines": row.get('Cuisines', 'Not specified'),
-                    "dietary": row.get('Dietary Info', 'Not specified'),
-                    "likes": int(row.get('Number of Likes', 0)),
-                    "relevance": relevance_score
-                }
-                
+            for i, suggestion in zip(ranked[:3], get_suggestions(sheet, ranked[:3], relevance[order[:3]])):
                 if api_mode:
                     suggestions.append(suggestion)
                 else:
@@ -388,7 +381,7 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
 
                     feedback = input("Bot: Like (.), Dislike (/), or skip: ").strip()
                     if feedback == '.':
-                        liked_restaurants.append(row['Restaurant Name'])
+                        liked_restaurants.append(data['Restaurant Name'].iat[i])
                         print("Bot: Thanks for the like! ❤️")
                     elif feedback == '/':
                         print("Bot: Got it, not your taste. 👎")
@@ -399,13 +392,14 @@ def search_engine(api_mode=False, city=None, query=None, liked=None):
                 return {"suggestions": suggestions}
 
             shown = 3
-            while shown < len(output):
+            while shown < len(ranked):
                 more = input("\nBot: Would you like to see more options? (yes/no): ").strip().lower()
                 if more in ['yes', 'y']:
-                    for _, row in output.iloc[shown:shown+2].iterrows():
-                        print(f"\n🍴 {row['Restaurant Name'].title()}")
-                        print(f"📝 {row.get('Description', 'No description available')}")
-                        print(f"📍 {row.get('Address', '')}, {row.get('State', '')}, {row.get('Country', '')}")
+                    for i in ranked[shown:shown+2]:
+                        record = sheet['catalog'].record(i)
+                        print(f"\n🍴 {record['name']}")
+                        print(f"📝 {record['description']}")
+                        print(f"📍 {record['address']}")
                     shown += 2
                 else:
                     print("Bot: Alright! Let me know if you want to search again. 🍽️")
@@ -0,0 +1,183 @@
+import argparse
+import hashlib
+import math
+import os
+import re
+import numpy as np
+import pandas as pd
+
+# bundled localities, neighbourhoods, streets and postcodes with approximate centroids;
+# nothing is looked up over the network
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+
+# most specific first: an address takes its best-ranked match
+PRECISIONS = ('street', 'area', 'postcode', 'town')
+
+# radius of a "near X" query by how precisely X is known, in km
+NEAR_KM = {'street': 1.0, 'area': 2.0, 'postcode': 2.0, 'town': 25.0}
+
+# a specific match further than this from the address's town is taken for a namesake elsewhere
+TOWN_KM = 30.0
+
+# side of a grid cell in km
+CELL_KM = 1.0
+
+# stored coordinate columns, filled by the pipeline
+COLUMNS = ['Latitude', 'Longitude', 'Geo Precision']
+
+EARTH_KM = 6371.0
+KM_PER_DEGREE = 111.2
+
+# words that introduce the place in a query
+PLACE_CUES = r'near(?:by)?|around|close to|next to|in|at'
+RADIUS_QUERY = re.compile(r'\bwithin\s+(\d+(?:\.\d+)?)\s*(km|m)\b(?:\s+(?:of|from))?\s+(.+)')
+PLACE_QUERY = re.compile(rf'\b(?:{PLACE_CUES})\s+(.+)')
+
+_gazetteer = None
+
+
+# name -> (lat, lon, precision) and one alternation over every name, longest names first
+def gazetteer():
+    global _gazetteer
+    if _gazetteer is None:
+        places = pd.read_csv(GAZETTEER_PATH, comment='#', dtype={'name': str})
+        places['name'] = places['name'].str.lower().str.strip()
+        table = {row.name: (row.lat, row.lon, row.precision) for row in places.itertuples(index=False)}
+        names = sorted(table, key=len, reverse=True)
+        pattern = re.compile(r'(?<![\w])(' + '|'.join(map(re.escape, names)) + r')(?![\w])')
+        _gazetteer = (table, pattern)
+    return _gazetteer
+
+
+# content hash of the gazetteer, so stored coordinates are redone when it changes
+def gazetteer_digest():
+    with open(GAZETTEER_PATH, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+# great-circle distance in km from one point to arrays of points
+def distance_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+# (lat, lon, precision) of one address, or None when it names nothing the gazetteer knows.
+# Matches rank by precision, then by position, since addresses run from specific to general;
+# the address's own town is its last town match, and a match far from it is a namesake
+# ("Jalan Kuantan, Kuala Lumpur") and is passed over
+def geocode(address):
+    table, pattern = gazetteer()
+    found = [(PRECISIONS.index(table[m.group(1)][2]), m.start(), table[m.group(1)])
+             for m in pattern.finditer(str(address).lower())]
+    if not found:
+        return None
+    found.sort(key=lambda match: match[:2])
+    towns = [place for _, _, place in sorted(found, key=lambda match: match[1]) if place[2] == 'town']
+    for _, _, place in found:
+        if not towns or distance_km(towns[-1][0], towns[-1][1], place[0], place[1]) <= TOWN_KM:
+            return place
+    return towns[-1]
+
+
+# the coordinate columns for a sheet's addresses; rows with no match keep NaN and no precision
+def add_coordinates(df):
+    df = df.copy()
+    texts = df['Address'].fillna('').astype(str)
+    if 'State' in df.columns:
+        texts = texts + ', ' + df['State'].fillna('').astype(str)
+    places = [geocode(text) for text in texts]
+    df['Latitude'] = [place[0] if place else np.nan for place in places]
+    df['Longitude'] = [place[1] if place else np.nan for place in places]
+    df['Geo Precision'] = [place[2] if place else '' for place in places]
+    return df
+
+
+# the place a query is about, as {'name', 'lat', 'lon', 'precision', 'radius'}: "within 3 km
+# of klcc" gives its own radius, "near klcc" / "in kuah" one by precision; None when the query
+# names no place the gazetteer knows
+def parse_place(query):
+    query = query.lower().strip()
+    radius = None
+    within = RADIUS_QUERY.search(query)
+    if within:
+        radius = float(within.group(1)) / (1000 if within.group(2) == 'm' else 1)
+        phrases = [within.group(3)]
+    else:
+        phrases = [m.group(1) for m in PLACE_QUERY.finditer(query)]
+    table, pattern = gazetteer()
+    for phrase in phrases:
+        match = pattern.search(phrase)
+        if match:
+            lat, lon, precision = table[match.group(1)]
+            return {'name': match.group(1), 'lat': lat, 'lon': lon, 'precision': precision,
+                    'radius': radius if radius is not None else NEAR_KM[precision]}
+    return None
+
+
+# rows bucketed into square cells, kept sorted by cell key; a radius query reads one
+# contiguous key range per row of cells through a binary search, then measures only those rows
+class GridIndex:
+    def __init__(self, lats, lons, cell_km=CELL_KM):
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        self.cell = cell_km / KM_PER_DEGREE
+        rows = np.flatnonzero(~(np.isnan(lats) | np.isnan(lons)))
+        keys = self._key(self._cell(lats[rows]), self._cell(lons[rows]))
+        order = np.argsort(keys, kind='stable')
+        self.keys = keys[order]
+        self.rows = rows[order]
+        self.lats = lats
+        self.lons = lons
+
+    def _cell(self, degrees):
+        return np.floor(np.asarray(degrees) / self.cell).astype(np.int64)
+
+    # latitude cell in the high bits, longitude cell in the low bits, so a row of cells is one key range
+    @staticmethod
+    def _key(lat_cells, lon_cells):
+        return (lat_cells + 2 ** 20) * 2 ** 22 + (lon_cells + 2 ** 21)
+
+    def __len__(self):
+        return len(self.rows)
+
+    # (row ids, km) of every located row within radius_km of the point, nearest first
+    def within(self, lat, lon, radius_km):
+        if not len(self.rows):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        lon_low, lon_high = self._cell(lon - dlon), self._cell(lon + dlon)
+        spans = []
+        for lat_cell in range(int(self._cell(lat - dlat)), int(self._cell(lat + dlat)) + 1):
+            start = np.searchsorted(self.keys, self._key(lat_cell, lon_low))
+            end = np.searchsorted(self.keys, self._key(lat_cell, lon_high), side='right')
+            if end > start:
+                spans.append(self.rows[start:end])
+        if not spans:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = np.concatenate(spans)
+        km = distance_km(lat, lon, self.lats[candidates], self.lons[candidates])
+        keep = km <= radius_km
+        candidates, km = candidates[keep], km[keep]
+        order = np.lexsort((candidates, km))
+        return candidates[order].astype(np.int64), km[order]
+
+
+if __name__ == "__main__":
+    import corpus
+    from chatbot_server import BOT_CONFIG
+    parser = argparse.ArgumentParser(description='Report how precisely the gazetteer places every sheet\'s addresses.')
+    parser.add_argument('--categories', nargs='+', default=list(BOT_CONFIG), choices=list(BOT_CONFIG))
+    args = parser.parse_args()
+
+    for category in args.categories:
+        settings = BOT_CONFIG[category]
+        for city, sheet_name in sorted(settings['sheet'].items()):
+            df = corpus.read_sheet(settings['filepath'], sheet_name)
+            if not set(COLUMNS) <= set(df.columns):
+                df = add_coordinates(df)
+            counts = df['Geo Precision'].fillna('').replace('', 'none').value_counts()
+            located = len(df) - counts.get('none', 0)
+            print(f"{category:<12} {city:<12} {located:>4}/{len(df):<4} located  " +
+                  '  '.join(f"{precision} {counts.get(precision, 0)}" for precision in PRECISIONS + ('none',)))
@@ -0,0 +1,133 @@
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import encoder
+import store
+
+# thread pools the encoder and FAISS read their size from when they start
+THREAD_ENV = ['OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS']
+
+
+# each worker gets an equal share of the cores, so workers x threads never exceeds them
+def threads_per_worker(workers, cores=None):
+    return max(1, (cores or os.cpu_count() or 1) // workers)
+
+
+def init_worker(threads):
+    import faiss
+    import torch
+    torch.set_num_threads(threads)
+    faiss.omp_set_num_threads(threads)
+
+
+# build and write the index of one sheet; runs in a worker process
+def build_shard(category, city, entry, force=False, chunk_rows=encoder.CHUNK_ROWS):
+    import corpus
+    from chatbot_server import BOT_CONFIG
+    settings = BOT_CONFIG[category]
+    module, filepath, sheet_name = settings['module'], settings['filepath'], settings['sheet'][city]
+    model_name = encoder.model_id()
+    result = {'key': store.index_key(filepath, sheet_name), 'category': category, 'city': city, 'pid': os.getpid()}
+
+    start = time.perf_counter()
+    prepared = module.preprocess_text(module.load_data(filepath, sheet_name))
+    df = prepared[0] if isinstance(prepared, tuple) else prepared
+    digest = store.texts_digest(df['search_text'])
+    loaded = time.perf_counter()
+    result.update({'rows': len(df), 'texts': digest, 'load_seconds': round(loaded - start, 3)})
+
+    path = store.index_path(filepath, sheet_name, model_name)
+    if not force and entry.get('texts') == digest and os.path.exists(path):
+        result.update({'status': 'skipped', 'seconds': round(loaded - start, 3)})
+        return result
+
+    index = corpus.build_index(df, module.create_embeddings, module.create_faiss_index, chunk_rows)
+    built = time.perf_counter()
+    store.write_index(filepath, sheet_name, model_name, index)
+    done = time.perf_counter()
+    result.update({'status': 'built', 'index_seconds': round(built - loaded, 3),
+                   'write_seconds': round(done - built, 3), 'seconds': round(done - start, 3)})
+    return result
+
+
+def run(jobs, workers=None, threads=None, force=False, chunk_rows=encoder.CHUNK_ROWS):
+    from chatbot_server import BOT_CONFIG
+    model_name = encoder.model_id()
+    manifest_path = store.index_manifest_path(model_name)
+    manifest = store.read_manifest(manifest_path)
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    threads = threads or threads_per_worker(workers)
+
+    # largest sheets first, so a big one is not left running alone at the end;
+    # sizes come from the last build, or the pipeline's manifest
+    sizes = store.read_manifest()
+    def rows(job):
+        category, city = job
+        settings = BOT_CONFIG[category]
+        key = store.index_key(settings['filepath'], settings['sheet'][city])
+        return manifest.get(key, sizes.get(f"{category}/{settings['sheet'][city]}", {})).get('rows', 0)
+    jobs = sorted(jobs, key=rows, reverse=True)
+
+    # spawned workers read the thread settings when they import torch and FAISS
+    for name in THREAD_ENV:
+        os.environ[name] = str(threads)
+    start = time.perf_counter()
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(threads,)) as executor:
+        futures = []
+        for category, city in jobs:
+            settings = BOT_CONFIG[category]
+            entry = manifest.get(store.index_key(settings['filepath'], settings['sheet'][city]), {})
+            futures.append(executor.submit(build_shard, category, city, entry, force, chunk_rows))
+        results = [future.result() for future in futures]
+    wall_seconds = time.perf_counter() - start
+
+    # each shard is already on disk; the manifest is written once all of them are
+    for result in results:
+        if result['status'] == 'built':
+            manifest[result['key']] = {'texts': result['texts'], 'rows': result['rows'],
+                                       'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    store.write_manifest(manifest, manifest_path)
+
+    # what the same shards cost one after another, against the wall clock of the pool
+    shard_seconds = sum(result['seconds'] for result in results)
+    return {
+        'config': {'model': model_name, 'workers': workers, 'threads_per_worker': threads, 'force': force,
+                   'chunk_rows': chunk_rows, 'cores': os.cpu_count()},
+        'wall_seconds': round(wall_seconds, 3),
+        'shard_seconds': round(shard_seconds, 3),
+        'speedup': round(shard_seconds / wall_seconds, 2) if wall_seconds else None,
+        'built': sum(result['status'] == 'built' for result in results),
+        'skipped': sum(result['status'] == 'skipped' for result in results),
+        'shards': results,
+    }
+
+
+if __name__ == "__main__":
+    from chatbot_server import BOT_CONFIG
+    cities = sorted(BOT_CONFIG['restaurants']['sheet'])
+    parser = argparse.ArgumentParser(description='Build the FAISS index of every sheet in parallel and write them into the store.')
+    parser.add_argument('--categories', nargs='+', default=list(BOT_CONFIG), choices=list(BOT_CONFIG))
+    parser.add_argument('--cities', nargs='+', default=cities, choices=cities)
+    parser.add_argument('--workers', type=int, help='sheets built in parallel, one process each (default: one per core)')
+    parser.add_argument('--threads', type=int, help='torch and FAISS threads per worker (default: cores / workers)')
+    parser.add_argument('--force', action='store_true', help='rebuild indexes whose sheet text did not change')
+    parser.add_argument('--chunk-rows', type=int, default=encoder.CHUNK_ROWS, help='rows encoded and added per chunk')
+    parser.add_argument('--report', help='write the JSON timing report here')
+    args = parser.parse_args()
+
+    jobs = [(category, city) for category in args.categories for city in args.cities if city in BOT_CONFIG[category]['sheet']]
+    report = run(jobs, args.workers, args.threads, args.force, args.chunk_rows)
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+
+    for result in sorted(report['shards'], key=lambda result: result['key']):
+        print(f"{result['key']:<50} {result['status']:<8} {result['rows']:>5} rows  {result['seconds']:>7.2f}s  pid {result['pid']}")
+    config = report['config']
+    print(f"\n{report['built']} built, {report['skipped']} skipped with {config['workers']} workers x "
+          f"{config['threads_per_worker']} threads in {report['wall_seconds']:.1f}s "
+          f"({report['shard_seconds']:.1f}s of shard time, {report['speedup']}x) -> {os.path.dirname(store.index_manifest_path(config['model']))}/")
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+WORKBOOKS = ['final_attractions.xlsx', 'final_hotels.xlsx', 'final_restaurants.xlsx']
+
+# share of each scenario in the traffic mix
+DEFAULT_MIX = {'chat': 70, 'paging': 20, 'like': 10}
+
+PERCENTILES = (50, 90, 95, 99)
+
+
+# (category, city, query) triples ranked in a seeded random order and drawn
+# with Zipf weights, so a few popular searches dominate as in real traffic
+class QueryPool:
+    def __init__(self, config, queries, zipf=1.1, seed=0):
+        rng = random.Random(seed)
+        self.items = [(category, city, query)
+                      for category, settings in config.items()
+                      for city in settings['sheet']
+                      for query in queries[category]]
+        rng.shuffle(self.items)
+        self.weights = [1 / (rank + 1) ** zipf for rank in range(len(self.items))]
+
+    def draw(self, rng):
+        return rng.choices(self.items, weights=self.weights, k=1)[0]
+
+
+# shared state between workers: results seen so far, for paging and likes
+class Session:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.searches = []
+        self.names = []
+
+    def remember(self, category, city, query, body):
+        names = [s.get('name') for s in body.get('suggestions', []) if s.get('name')]
+        with self.lock:
+            if body.get('next_cursor'):
+                self.searches.append((category, city, query, body['next_cursor']))
+            self.names.extend((category, city, name) for name in names)
+
+
+def http_post(base_url):
+    def post(path, payload):
+        request = urllib.request.Request(base_url.rstrip('/') + path, data=json.dumps(payload).encode('utf-8'),
+                                         headers={'Content-Type': 'application/json'}, method='POST')
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as e:
+            return e.code, {}
+    return post
+
+
+def in_process_post():
+    import chatbot_server
+    local = threading.local()
+
+    def post(path, payload):
+        if not hasattr(local, 'client'):
+            local.client = chatbot_server.app.test_client()
+        response = local.client.post(path, json=payload)
+        return response.status_code, response.get_json(silent=True) or {}
+    return post
+
+
+# one request of the chosen scenario; falls back to chat until there is
+# something to page through or like
+def step(post, scenario, pool, session, rng):
+    with session.lock:
+        searches, names = list(session.searches), list(session.names)
+    if scenario == 'paging' and searches:
+        category, city, query, cursor = rng.choice(searches)
+        payload = {'city': city, 'category': category, 'query': query, 'cursor': cursor, 'limit': 2}
+        return 'paging', '/show_more', payload, None
+    if scenario == 'like' and names:
+        category, city, name = rng.choice(names)
+        return 'like', '/like', {'city': city, 'category': category, 'name': name}, None
+    category, city, query = pool.draw(rng)
+    return 'chat', '/chat', {'city': city, 'category': category, 'query': query}, (category, city, query)
+
+
+def worker(post, plan, pool, session, seed, results):
+    rng = random.Random(seed)
+    for scenario in plan:
+        name, path, payload, search = step(post, scenario, pool, session, rng)
+        start = time.perf_counter()
+        try:
+            status, body = post(path, payload)
+        except Exception:
+            status, body = None, {}
+        elapsed = time.perf_counter() - start
+        if search and status == 200:
+            session.remember(*search, body)
+        results.append((name, elapsed, status))
+
+
+def summarize(samples, wall_seconds):
+    latencies = np.array([elapsed for _, elapsed, _ in samples]) * 1000
+    errors = sum(1 for _, _, status in samples if status is None or status >= 400)
+    summary = {'requests': len(samples), 'errors': errors,
+               'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+               'throughput_rps': round(len(samples) / wall_seconds, 2) if wall_seconds else None}
+    if len(latencies):
+        summary.update({f'p{p}_ms': round(float(np.percentile(latencies, p)), 3) for p in PERCENTILES})
+        summary['max_ms'] = round(float(latencies.max()), 3)
+    return summary
+
+
+# copies of the workbooks in a scratch directory, so likes do not touch the real data
+def scratch_workbooks():
+    directory = tempfile.mkdtemp(prefix='trip-loadtest-')
+    for workbook in WORKBOOKS:
+        shutil.copy(workbook, directory)
+    os.chdir(directory)
+    return directory
+
+
+def run(post, config, queries, total, concurrency, mix, zipf=1.1, seed=0):
+    pool = QueryPool(config, queries, zipf, seed)
+    rng = random.Random(seed)
+    scenarios = rng.choices(list(mix), weights=list(mix.values()), k=total)
+    plans = [scenarios[i::concurrency] for i in range(concurrency)]
+    session, results = Session(), []
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i, plan in enumerate(plans):
+            executor.submit(worker, post, plan, pool, session, seed + i + 1, results)
+    wall_seconds = time.perf_counter() - start
+
+    report = {'overall': summarize(results, wall_seconds), 'scenarios': {}}
+    for name in mix:
+        samples = [r for r in results if r[0] == name]
+        if samples:
+            report['scenarios'][name] = summarize(samples, wall_seconds)
+    return report
+
+
+# SLO violations as readable strings; empty when the run passed
+def check_slo(report, p95_ms, p99_ms, max_error_rate):
+    overall, failures = report['overall'], []
+    if p95_ms is not None and overall.get('p95_ms', 0) > p95_ms:
+        failures.append(f"p95 {overall['p95_ms']} ms > {p95_ms} ms")
+    if p99_ms is not None and overall.get('p99_ms', 0) > p99_ms:
+        failures.append(f"p99 {overall['p99_ms']} ms > {p99_ms} ms")
+    if overall['error_rate'] > max_error_rate:
+        failures.append(f"error rate {overall['error_rate']} > {max_error_rate}")
+    return failures
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown scenario: {name}')
+        mix[name] = float(weight)
+    return mix
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Drive /chat, /show_more and /like with a realistic traffic mix.')
+    parser.add_argument('--url', help='base URL of a running server; omit to serve in-process on scratch copies of the workbooks')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help='e.g. chat=70,paging=20,like=10')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent of the query popularity')
+    parser.add_argument('--queries', type=int, default=30, help='synthetic queries per category')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--stub-encoder', action='store_true', help='use the hashing encoder instead of the model (in-process only)')
+    parser.add_argument('--slo-p95-ms', type=float)
+    parser.add_argument('--slo-p99-ms', type=float)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    if args.stub_encoder:
+        os.environ['TRIP_ENCODER'] = 'stub'
+    import benchmark
+    from chatbot_server import BOT_CONFIG
+
+    queries = {category: benchmark.FIXED_QUERIES[category] + benchmark.synthetic_queries(category, args.queries, args.seed)
+               for category in BOT_CONFIG}
+    output = os.path.abspath(args.output) if args.output else None
+    if args.url:
+        post = http_post(args.url)
+    else:
+        scratch_workbooks()
+        post = in_process_post()
+
+    report = run(post, BOT_CONFIG, queries, args.requests, args.concurrency, args.mix, args.zipf, args.seed)
+    report['config'] = {'url': args.url, 'requests': args.requests, 'concurrency': args.concurrency,
+                        'mix': args.mix, 'zipf': args.zipf, 'seed': args.seed,
+                        'encoder': os.environ.get('TRIP_ENCODER') or 'model'}
+    failures = check_slo(report, args.slo_p95_ms, args.slo_p99_ms, args.max_error_rate)
+    report['slo'] = {'passed': not failures, 'failures': failures}
+
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text)
+    else:
+        print(text)
+    sys.exit(1 if failures else 0)
@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+
+STAGE_SECONDS = 'trip_stage_duration_seconds'
+REQUEST_SECONDS = 'trip_request_duration_seconds'
+LIKE_FLUSH_SECONDS = 'trip_like_flush_duration_seconds'
+LIKE_FLUSH_LAG_SECONDS = 'trip_like_flush_lag_seconds'
+REQUESTS = 'trip_requests_total'
+CACHE_REQUESTS = 'trip_cache_requests_total'
+
+HELP = {
+    STAGE_SECONDS: 'Time spent in each search pipeline stage.',
+    REQUEST_SECONDS: 'End-to-end time of each HTTP request.',
+    LIKE_FLUSH_SECONDS: 'Time taken to write liked items back to the store or workbook.',
+    LIKE_FLUSH_LAG_SECONDS: 'Time from a like reaching the flush until it is written, including waits for other flushes.',
+    REQUESTS: 'HTTP requests served.',
+    CACHE_REQUESTS: 'Lookups in the sheet, facet, spelling and stored index caches.',
+}
+
+# seconds; sheet builds that encode a whole city land in the upper buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_lock = threading.Lock()
+# name -> label tuple -> [bucket counts, sum, count]
+_histograms = {}
+# name -> label tuple -> value
+_counters = {}
+# category and city of the request being served on this thread
+_context = threading.local()
+
+
+# label every metric recorded on this thread until the next bind()
+def bind(**labels):
+    _context.labels = labels
+
+
+def _labels(labels):
+    merged = dict(getattr(_context, 'labels', {}))
+    merged.update(labels)
+    return tuple(sorted(merged.items()))
+
+
+def observe(name, value, **labels):
+    key = _labels(labels)
+    with _lock:
+        series = _histograms.setdefault(name, {}).setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+
+def inc(name, amount=1, **labels):
+    key = _labels(labels)
+    with _lock:
+        counters = _counters.setdefault(name, {})
+        counters[key] = counters.get(key, 0) + amount
+
+
+# time a block into a histogram; also usable as a decorator
+@contextmanager
+def timer(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+
+# time one pipeline stage, e.g. @metrics.timed('find_relevant_rows')
+def timed(stage):
+    return timer(STAGE_SECONDS, stage=stage)
+
+
+def _format(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ''
+    text = ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+    return '{' + text + '}'
+
+
+# hits / lookups per cache, derived from the cache counters
+def _hit_ratios(counters):
+    totals = {}
+    for key, value in counters.items():
+        labels = dict(key)
+        hits, lookups = totals.get(labels.get('cache'), (0, 0))
+        totals[labels.get('cache')] = (hits + (value if labels.get('result') == 'hit' else 0), lookups + value)
+    return {cache: hits / lookups for cache, (hits, lookups) in totals.items() if lookups}
+
+
+# everything recorded so far in the Prometheus text exposition format
+def render():
+    lines = []
+    with _lock:
+        for name, series in sorted(_histograms.items()):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} histogram')
+            for key, (buckets, total, count) in sorted(series.items()):
+                for bound, n in zip(BUCKETS, buckets):
+                    lines.append(f'{name}_bucket{_format(key, [("le", bound)])} {n}')
+                lines.append(f'{name}_bucket{_format(key, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{_format(key)} {total:.6f}')
+                lines.append(f'{name}_count{_format(key)} {count}')
+        for name, series in sorted(_counters.items()):
+            lines.append(f'# HELP {name} {HELP.get(name, name)}')
+            lines.append(f'# TYPE {name} counter')
+            for key, value in sorted(series.items()):
+                lines.append(f'{name}{_format(key)} {value}')
+        ratios = _hit_ratios(_counters.get(CACHE_REQUESTS, {}))
+    if ratios:
+        lines.append('# HELP trip_cache_hit_ratio Share of cache lookups served from memory.')
+        lines.append('# TYPE trip_cache_hit_ratio gauge')
+        for cache, ratio in sorted(ratios.items()):
+            lines.append(f'trip_cache_hit_ratio{{cache="{cache}"}} {ratio:.4f}')
+    return '\n'.join(lines) + '\n'
+
+
+# (sum, count) per label set of one histogram
+def totals(name):
+    with _lock:
+        return {key: (total, count) for key, (_, total, count) in _histograms.get(name, {}).items()}
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
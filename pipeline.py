@@ -0,0 +1,234 @@
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import corpus
+import encoder
+import facets
+import geo
+import store
+from chatbot_server import BOT_CONFIG
+
+# bump when the imputation rules change so every sheet is rebuilt
+RULES_VERSION = 1
+
+# raw API workbook and sheet per city and category, as exported for each city
+CITIES = {
+    'kl': {'source': 'KL_api.xlsx',
+           'sheets': {'hotels': 'Hotels_KL', 'restaurants': 'Restaurants_KL', 'attractions': 'Attractions_KL'}},
+    'ipoh': {'source': 'Ipoh_api.xlsx',
+             'sheets': {'hotels': 'Ipoh_cleanedhotels_api', 'restaurants': 'Ipoh_cleanedrestaurants_api',
+                        'attractions': 'Ipoh_cleanedattractions_api'}},
+    'langkawi': {'source': 'Langkawi_api.xlsx',
+                 'sheets': {'hotels': 'Langkawi_cleanedhotels_api', 'restaurants': 'Langkawi_cleanedrestaurants_api',
+                            'attractions': 'Langkawi_cleanedattractions_api'}},
+    'penang': {'source': 'Penang_api.xlsx',
+               'sheets': {'hotels': 'Penang_cleanedhotels_api', 'restaurants': 'Penang_cleanedrestaurants_api',
+                          'attractions': 'Penang_cleanedattractions_api'}},
+    'putrajaya': {'source': 'selangor_dataset.xlsx',
+                  'sheets': {'hotels': 'putrajaya_hotels_api', 'restaurants': 'putrajaya_restaurants_api',
+                             'attractions': 'putrajaya_attractions_api'}},
+    'sabah': {'source': 'Sabah_api.xlsx',
+              'sheets': {'hotels': 'sabah_cleanedhotels_api', 'restaurants': 'sabah_cleanedrestaurants_api',
+                         'attractions': 'sabah_cleanedattractions_api'}},
+    'johorbahru': {'source': 'JB_api.xlsx',
+                   'sheets': {'hotels': 'JB_cleanedhotels_api', 'restaurants': 'JB_cleanedrestaurants_api',
+                              'attractions': 'JB_cleanedattractions_api'}},
+    'melaka': {'source': 'melaka_api.xlsx',
+               'sheets': {'hotels': 'melaka_hotels_api', 'restaurants': 'melaka_restaurants_api',
+                          'attractions': 'melaka_attractions_api'}},
+    'sarawak': {'source': 'sarawak_dataset.xlsx',
+                'sheets': {'hotels': 'sarawak_hotels', 'restaurants': 'sarawak_restaurants', 'attractions': 'sarawak_attractions'}},
+    'selangor': {'source': 'selangor_dataset.xlsx',
+                 'sheets': {'hotels': 'selangor_hotels', 'restaurants': 'selangor_restaurants',
+                            'attractions': 'selangor_attractions'}},
+}
+
+NO_LINK = 'No link available'
+
+# link columns filled with NO_LINK per category (whichever exist in the sheet)
+LINK_COLUMNS = {
+    'hotels': ['Website'],
+    'restaurants': ['Website', 'Menu Url', 'Menu URL'],
+    'attractions': ['Website'],
+}
+
+
+def _text(values):
+    return values.astype(object).where(values.notna(), '').astype(str)
+
+
+# rule-based imputation, each rule a whole-column operation
+def hotel_descriptions(df):
+    return (_text(df['Hotel Name']) + ' located in ' + _text(df['Address'])
+            + ' is a comfortable and well-equipped hotel offering excellent services.')
+
+
+def restaurant_descriptions(df):
+    cuisine_cols = facets.tag_columns(df, 'Cuisines')
+    diet_cols = facets.tag_columns(df, 'Dietary Restrictions')
+    diet = df[diet_cols].astype(object)
+    halal = (diet == 'Halal').any(axis=1).to_numpy()
+    cuisines = corpus.join_nonempty(df[cuisine_cols].astype(object).where(df[cuisine_cols].notna(), ''), cuisine_cols)
+    dietary = corpus.join_nonempty(diet.where(diet.notna() & (diet != 'Halal'), ''), diet_cols)
+
+    has_cuisines = (cuisines != '').to_numpy()
+    description = np.where(has_cuisines, _text(df['Restaurant Name']) + ' offers a variety of cuisines including ' + cuisines + '.',
+                           'No Description available').astype(object)
+    description += np.where(has_cuisines & (dietary != '').to_numpy(), ' It also provides ' + dietary, '')
+    description += np.where(has_cuisines & halal, ' and it is Halal.', '')
+    return pd.Series(description, index=df.index)
+
+
+def attraction_descriptions(df):
+    cols = facets.tag_columns(df, 'Subcategories')
+    subcategories = corpus.join_nonempty(df[cols].astype(object).where(df[cols].notna(), ''), cols)
+    described = _text(df['Attraction Name']) + ' is a popular attraction featuring ' + subcategories + '.'
+    return described.where(subcategories != '', np.nan)
+
+
+DESCRIPTIONS = {
+    'hotels': hotel_descriptions,
+    'restaurants': restaurant_descriptions,
+    'attractions': attraction_descriptions,
+}
+
+
+# fill missing descriptions and links; rows that already have them are left alone
+def impute(category, df):
+    df = df.copy()
+    if 'Description' not in df.columns:
+        df['Description'] = np.nan
+    df['Description'] = df['Description'].fillna(DESCRIPTIONS[category](df))
+    for col in LINK_COLUMNS[category]:
+        if col in df.columns:
+            df[col] = df[col].fillna(NO_LINK)
+    if 'Number of Likes' not in df.columns:
+        df['Number of Likes'] = 0
+    df['Number of Likes'] = pd.to_numeric(df['Number of Likes'], errors='coerce').fillna(0).astype(int)
+    return df
+
+
+# likes are serving state: keep the ones already in the store, matched by name
+def keep_likes(df, stored, name_col):
+    if stored is None or name_col not in stored.columns:
+        return df
+    likes = stored.drop_duplicates(name_col).set_index(name_col)['Number of Likes']
+    df['Number of Likes'] = df[name_col].map(likes).fillna(df['Number of Likes']).astype(int)
+    return df
+
+
+# content hash of a source sheet plus everything that shapes the cleaned output
+def input_hash(df):
+    digest = hashlib.sha256(json.dumps([RULES_VERSION, geo.gazetteer_digest(), list(map(str, df.columns))]).encode())
+    digest.update(pd.util.hash_pandas_object(df.drop(columns=['Number of Likes'], errors='ignore'), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def read_source(source, raw_dir, city, category):
+    if source == 'raw':
+        config = CITIES[city]
+        return pd.read_excel(os.path.join(raw_dir, config['source']), sheet_name=config['sheets'][category])
+    settings = BOT_CONFIG[category]
+    return pd.read_excel(settings['filepath'], sheet_name=settings['sheet'][city])
+
+
+# the search_text the server will embed: the stored sheet run through the bot's own steps
+def search_texts(module, filepath, sheet_name):
+    prepared = module.preprocess_text(module.load_data(filepath, sheet_name))
+    prepared = prepared[0] if isinstance(prepared, tuple) else prepared
+    return prepared['search_text'].tolist()
+
+
+# clean and store the three sheets of one city; runs in a worker process
+def process_city(city, source, raw_dir, manifest, embed=True, force=False):
+    results = []
+    for category, settings in BOT_CONFIG.items():
+        if source == 'raw' and category not in CITIES.get(city, {}).get('sheets', {}):
+            continue
+        filepath, sheet_name = settings['filepath'], settings['sheet'][city]
+        key = f'{category}/{sheet_name}'
+        start = time.perf_counter()
+
+        raw = read_source(source, raw_dir, city, category)
+        digest = input_hash(raw)
+        if not force and manifest.get(key, {}).get('input_hash') == digest and store.has_sheet(filepath, sheet_name):
+            result = {'key': key, 'status': 'skipped', 'input_hash': digest, 'rows': len(raw)}
+        else:
+            df = keep_likes(impute(category, raw), store.read_sheet(filepath, sheet_name), settings['name_col'])
+            # coordinates from the bundled gazetteer, for the bots' grid indexes
+            df = geo.add_coordinates(df)
+            store.write_sheet(filepath, sheet_name, df)
+            result = {'key': key, 'status': 'built', 'input_hash': digest, 'rows': len(df),
+                      'seconds': round(time.perf_counter() - start, 3)}
+
+        # skipped sheets report their text too, so a missing or new model's pool gets filled
+        if embed:
+            result['texts'] = search_texts(settings['module'], filepath, sheet_name)
+        results.append(result)
+    return results
+
+
+# encode each distinct text once across all sheets and runs, streaming chunks into the pool;
+# the rest come from the pool
+def embed_texts(texts, chunk_rows=encoder.CHUNK_ROWS, batch_size=encoder.BATCH_SIZE):
+    model_name = encoder.model_id()
+    keys = [store.content_key(text, model_name) for text in texts]
+    missing = set(store.missing_keys(keys, model_name))
+    pending = {}
+    for key, text in zip(keys, texts):
+        if key in missing:
+            pending.setdefault(key, store.normalise_text(text))
+    if pending:
+        chunks = encoder.encode_chunks(list(pending.values()), chunk_rows, batch_size)
+        store.append_vectors(model_name, list(pending), chunks, encoder.get_model().get_sentence_embedding_dimension())
+    return {'texts': len(texts), 'unique': len(set(keys)), 'encoded': len(pending)}
+
+
+def run(cities, source='serving', raw_dir='raw', workers=None, embed=True, force=False,
+        chunk_rows=encoder.CHUNK_ROWS, batch_size=encoder.BATCH_SIZE):
+    manifest = store.read_manifest()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(process_city, city, source, raw_dir, manifest, embed, force) for city in cities]
+        for future in futures:
+            results.extend(future.result())
+
+    texts = [text for result in results for text in result.pop('texts', [])]
+    embedding = embed_texts(texts, chunk_rows, batch_size) if embed else None
+    for result in results:
+        if result['status'] == 'built':
+            manifest[result['key']] = {'input_hash': result['input_hash'], 'rows': result['rows'],
+                                       'built_at': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    store.write_manifest(manifest)
+    return results, embedding
+
+
+if __name__ == "__main__":
+    all_cities = sorted(BOT_CONFIG['restaurants']['sheet'])
+    parser = argparse.ArgumentParser(description='Clean every city and write the sheets and embeddings into the serving store.')
+    parser.add_argument('--source', default='serving', choices=['serving', 'raw'],
+                        help='serving re-cleans the final_*.xlsx workbooks, raw reads the per-city API exports in --raw-dir')
+    parser.add_argument('--raw-dir', default='raw')
+    parser.add_argument('--cities', nargs='+', default=None, choices=all_cities)
+    parser.add_argument('--workers', type=int, help='cities processed in parallel')
+    parser.add_argument('--no-embeddings', action='store_true', help='only write the cleaned sheets')
+    parser.add_argument('--force', action='store_true', help='rebuild sheets whose inputs did not change')
+    parser.add_argument('--chunk-rows', type=int, default=encoder.CHUNK_ROWS, help='texts encoded and written per chunk')
+    parser.add_argument('--batch-size', type=int, default=encoder.BATCH_SIZE, help='texts per encoder forward pass')
+    args = parser.parse_args()
+
+    cities = args.cities or (all_cities if args.source == 'serving' else sorted(CITIES))
+    start = time.perf_counter()
+    results, embedding = run(cities, args.source, args.raw_dir, args.workers, not args.no_embeddings, args.force,
+                             args.chunk_rows, args.batch_size)
+    for result in results:
+        print(f"{result['key']:<40} {result['status']:<8} {result['rows']:>5} rows  {result.get('seconds', '')}")
+    built = sum(result['status'] == 'built' for result in results)
+    print(f"\n{built} built, {len(results) - built} skipped in {time.perf_counter() - start:.1f}s -> {store.root()}/")
+    if embedding:
+        print(f"{embedding['texts']} texts, {embedding['unique']} distinct, {embedding['encoded']} encoded")
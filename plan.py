@@ -0,0 +1,146 @@
+import numpy as np
+import corpus
+import geo
+import metrics
+import similar
+
+# hotels per plan and restaurants per attraction
+HOTELS = 3
+RESTAURANTS = 2
+# search radii in km, widened in turn until enough candidates are found
+RESTAURANT_KM = (1.0, 2.0, 5.0, 10.0)
+HOTEL_KM = (2.0, 5.0, 10.0, 25.0, 50.0)
+# weights of the plan score: closeness within the search radius, and similarity of
+# the item's embedding to the attractions it serves
+PLAN_WEIGHTS = {'distance': 0.7, 'similarity': 0.3}
+
+
+def _sheet(settings, city):
+    return corpus.get_sheet(settings['filepath'], settings['sheet'][city], settings['module'].build_sheet)
+
+
+# rows of the grid around a point in the first radius that holds enough of them, with their distances
+def _candidates(grid, lat, lon, radii, needed):
+    for radius in radii:
+        ids, km = grid.within(lat, lon, radius)
+        if len(ids) >= needed:
+            break
+    return ids, km, radius
+
+
+# visiting order of points: start at the one furthest from their centre, then always
+# go to the nearest one not yet visited
+def _route(lats, lons):
+    order = [int(np.argmax(geo.distance_km(lats.mean(), lons.mean(), lats, lons)))]
+    left = set(range(len(lats))) - set(order)
+    while left:
+        rest = np.array(sorted(left))
+        step = rest[np.argmin(geo.distance_km(lats[order[-1]], lons[order[-1]], lats[rest], lons[rest]))]
+        order.append(int(step))
+        left.remove(step)
+    return order
+
+
+def _item(catalog, i, score, km=None):
+    return catalog.suggestion(i, round(float(score), 2), distance_km=None if km is None else round(float(km), 2))
+
+
+# the best scored candidates not yet used elsewhere in the plan
+def _pick(catalog, ids, scores, km, used, limit):
+    fresh = np.array([i not in used for i in ids], dtype=bool)
+    ids, scores = ids[fresh], scores[fresh]
+    km = km[fresh] if km is not None else None
+    top = corpus.top_k(scores, limit)
+    used.update(int(i) for i in ids[top])
+    return [_item(catalog, ids[j], scores[j], km[j] if km is not None else None) for j in top]
+
+
+# blended plan scores: closeness against the radius searched, similarity against a unit vector
+def _scores(km, radius, vectors, target):
+    closeness = np.clip(1 - km / radius, 0, 1)
+    return PLAN_WEIGHTS['distance'] * closeness + PLAN_WEIGHTS['similarity'] * (vectors @ target)
+
+
+# restaurants for one stop: around it when it has coordinates, its precomputed neighbours
+# when it has none or nothing is within reach
+def _restaurants(config, city, attractions, restaurants, row, used, limit):
+    grid = attractions['grid']
+    if not np.isnan(grid.lats[row]):
+        ids, km, radius = _candidates(restaurants['grid'], grid.lats[row], grid.lons[row], RESTAURANT_KM, limit + len(used))
+        if len(ids) > 0:
+            scores = _scores(km, radius, restaurants['embeddings'][ids], attractions['embeddings'][row])
+            return _pick(restaurants['catalog'], ids, scores, km, used, limit)
+    indptr, indices, scores = similar.get_graph(config, city)[('attractions', 'restaurants')]
+    ids, scores = indices[indptr[row]:indptr[row + 1]], scores[indptr[row]:indptr[row + 1]]
+    return _pick(restaurants['catalog'], ids, scores.astype(np.float64), None, used, limit)
+
+
+# hotels central to the located stops, by their mean distance to them; the nearest located
+# hotels however far when none is within the widest radius, and by similarity alone when
+# no stop or no hotel has coordinates
+def _hotels(attractions, hotels, rows, limit):
+    grid, hotel_grid = attractions['grid'], hotels['grid']
+    target = attractions['embeddings'][rows].mean(axis=0)
+    target = target / max(np.linalg.norm(target), 1e-12)
+    located = [row for row in rows if not np.isnan(grid.lats[row])]
+    if located:
+        lats, lons = grid.lats[located], grid.lons[located]
+        ids, _, radius = _candidates(hotel_grid, lats.mean(), lons.mean(), HOTEL_KM, limit)
+        far = len(ids) == 0
+        if far:
+            ids = np.flatnonzero(~np.isnan(hotel_grid.lats))
+        if len(ids) > 0:
+            km = np.mean([geo.distance_km(lat, lon, hotel_grid.lats[ids], hotel_grid.lons[ids])
+                          for lat, lon in zip(lats, lons)], axis=0)
+            # a candidate's mean distance to the stops is at most the radius plus the stops' own
+            # spread; far candidates are scored by how much further than the nearest one they are
+            if far:
+                scores = _scores(km - km.min(), max(np.ptp(km), 1e-12), hotels['embeddings'][ids], target)
+            else:
+                spread = geo.distance_km(lats.mean(), lons.mean(), lats, lons).mean()
+                scores = _scores(km, radius + spread, hotels['embeddings'][ids], target)
+            return _pick(hotels['catalog'], ids, scores, km, set(), limit)
+    scores = hotels['embeddings'] @ target
+    return _pick(hotels['catalog'], np.arange(len(scores)), scores, None, set(), limit)
+
+
+# an itinerary for liked attractions: the stops split over days in visiting order, with
+# restaurants near each stop and hotels central to all of them. Everything comes from
+# structures built with the sheets (grid indexes, embeddings, neighbour graph), so a plan
+# costs a few grid lookups and small dot products, and no query is encoded
+@metrics.timed('plan')
+def make_plan(config, city, names, days=1, hotels=HOTELS, restaurants=RESTAURANTS):
+    settings = config['attractions']
+    attractions = _sheet(settings, city)
+    rows = corpus.name_rows(settings['filepath'], settings['sheet'][city], attractions, settings['name_col'])
+    found, unknown = [], []
+    for name in names:
+        row = rows.get(str(name).lower().strip())
+        if row is None:
+            unknown.append(name)
+        elif row not in found:
+            found.append(row)
+    if not found:
+        return {'days': [], 'hotels': [], 'unknown': unknown}
+
+    grid = attractions['grid']
+    located = [row for row in found if not np.isnan(grid.lats[row])]
+    route = [located[i] for i in _route(grid.lats[located], grid.lons[located])] if located else []
+    route += [row for row in found if row not in located]
+
+    restaurant_sheet = _sheet(config['restaurants'], city)
+    used = set()
+    plan_days = []
+    for day, stops in enumerate(np.array_split(np.array(route), max(1, min(days, len(route)))), start=1):
+        entries = []
+        for position, row in enumerate(stops):
+            previous = stops[position - 1] if position else None
+            leg = None
+            if previous is not None and not np.isnan(grid.lats[row]) and not np.isnan(grid.lats[previous]):
+                leg = geo.distance_km(grid.lats[previous], grid.lons[previous], grid.lats[row], grid.lons[row])
+            entries.append({'attraction': _item(attractions['catalog'], row, 1.0, leg),
+                            'restaurants': _restaurants(config, city, attractions, restaurant_sheet, row, used, restaurants)})
+        plan_days.append({'day': day, 'stops': entries})
+
+    return {'days': plan_days, 'hotels': _hotels(attractions, _sheet(config['hotels'], city), found, hotels),
+            'unknown': unknown}
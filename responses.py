@@ -0,0 +1,75 @@
+import json
+import math
+import numpy as np
+from flask import Response
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, Suggestion):
+        return value.to_dict()
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if math.isnan(value) else float(value)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# orjson when installed, the standard library otherwise
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+# static part of each item's JSON object, serialized once when the corpus loads:
+# b'"name":"...","description":"...",...' without the braces
+def fragments(display):
+    records = display.astype(object).where(display.notna(), None).to_dict('records')
+    return [dumps(record)[1:-1] for record in records]
+
+
+# a suggestion: its row's pre-serialized static fields plus the per-request fields (likes,
+# relevance, ...). It encodes by splicing the two, so the fragment is never decoded on the
+# way out; the static fields are decoded only when something reads them, e.g. a suggestion
+# nested deeper in a payload than encode() splices, or a terminal print
+class Suggestion:
+    __slots__ = ('fragment', 'fields', '_record')
+
+    def __init__(self, fragment, **fields):
+        self.fragment = fragment
+        self.fields = fields
+        self._record = None
+
+    def to_json(self):
+        return b'{%s,%s' % (self.fragment, dumps(self.fields)[1:])
+
+    def to_dict(self):
+        if self._record is None:
+            self._record = dict(json.loads(b'{%s}' % self.fragment), **self.fields)
+        return self._record
+
+    def __getitem__(self, key):
+        return self.fields[key] if key in self.fields else self.to_dict()[key]
+
+
+# encode a bot response, splicing the dynamic fields into each fragment
+def encode(payload):
+    suggestions = payload.get('suggestions')
+    if not suggestions or not all(isinstance(s, Suggestion) for s in suggestions):
+        return dumps(payload)
+    envelope = dumps({key: value for key, value in payload.items() if key != 'suggestions'})
+    body = b','.join(s.to_json() for s in suggestions)
+    return b'{"suggestions":[%s]%s%s' % (body, b',' if len(envelope) > 2 else b'', envelope[1:])
+
+
+@metrics.timed('serialization')
+def json_response(payload, status=200):
+    return Response(encode(payload), status=status, mimetype='application/json')
@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+import numpy as np
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+# seconds a session lives after its last request
+SESSION_TTL = int(os.environ.get('TRIP_SESSION_TTL', 1800))
+# sessions held in memory before the least recently used are dropped
+MAX_SESSIONS = 100000
+# TRIP_SESSION_URL=redis://host:6379/0 shares sessions between server processes
+SESSION_URL_ENV = 'TRIP_SESSION_URL'
+
+_backend = None
+_backend_guard = threading.Lock()
+
+
+# in-process sessions with a sliding TTL; kept in last-use order, so expired
+# and surplus sessions are always at the front
+class MemoryBackend:
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, session_id):
+        with self._lock:
+            item = self._items.get(session_id)
+            if item is None or item[0] < time.monotonic():
+                return None
+            return item[1]
+
+    def put(self, session_id, state):
+        now = time.monotonic()
+        with self._lock:
+            self._items[session_id] = (now + self.ttl, state)
+            self._items.move_to_end(session_id)
+            while self._items and (len(self._items) > self.max_sessions or next(iter(self._items.values()))[0] < now):
+                self._items.popitem(last=False)
+
+    def __len__(self):
+        return len(self._items)
+
+
+# sessions as JSON in Redis, shared by every server process
+class RedisBackend:
+    def __init__(self, url, ttl=SESSION_TTL):
+        self.ttl = ttl
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, session_id):
+        raw = self.client.get('trip:session:' + session_id)
+        return json.loads(raw) if raw else None
+
+    def put(self, session_id, state):
+        self.client.set('trip:session:' + session_id, json.dumps(state), ex=self.ttl)
+
+
+# Redis when TRIP_SESSION_URL is set and redis is installed, memory otherwise
+def backend():
+    global _backend
+    with _backend_guard:
+        if _backend is None:
+            url = os.environ.get(SESSION_URL_ENV)
+            if url and redis is None:
+                print(f"Sessions: redis is not installed, keeping sessions in memory instead of {url}")
+            _backend = RedisBackend(url) if url and redis is not None else MemoryBackend()
+        return _backend
+
+
+def set_backend(new_backend):
+    global _backend
+    with _backend_guard:
+        _backend = new_backend
+
+
+# the session's state, or a fresh one under a new id when it is unknown or expired
+def load(session_id=None):
+    state = backend().get(session_id) if session_id else None
+    if state is None:
+        return uuid.uuid4().hex, {'liked': {}, 'results': None}
+    return session_id, state
+
+
+def save(session_id, state):
+    backend().put(session_id, state)
+
+
+# the liked names this session has not sent before; they are recorded, so each like counts once
+def new_likes(state, key, names):
+    seen = state['liked'].setdefault(key, [])
+    fresh = []
+    for name in names:
+        name = str(name).lower().strip()
+        if name and name not in seen and name not in fresh:
+            fresh.append(name)
+    seen.extend(fresh)
+    return fresh
+
+
+# fold a liked item's embedding into the running mean of the category's liked embeddings
+def add_preference(state, category, vector):
+    entry = state.setdefault('preference', {}).setdefault(category, {'centroid': None, 'count': 0})
+    vector = np.asarray(vector, dtype=np.float32)
+    centroid = vector if entry['centroid'] is None else np.asarray(entry['centroid'], dtype=np.float32)
+    entry['count'] += 1
+    entry['centroid'] = (centroid + (vector - centroid) / entry['count']).tolist()
+
+
+# the unit-length centroid of what the session liked in a category, or None before any like
+def preference(state, category):
+    entry = state.get('preference', {}).get(category)
+    if entry is None:
+        return None
+    centroid = np.asarray(entry['centroid'], dtype=np.float32)
+    norm = np.linalg.norm(centroid)
+    return centroid / norm if norm > 0 else None
+
+
+# the cursor of the next page of the session's last search
+def remember(state, sheet_name, query, next_cursor):
+    state['results'] = {'sheet': sheet_name, 'query': query, 'cursor': next_cursor}
+
+
+# the last search when it matches the sheet (and the query, when one is given)
+def results(state, sheet_name, query=None):
+    last = state.get('results')
+    if last is None or last['sheet'] != sheet_name or (query and last['query'] != query):
+        return None
+    return last
@@ -0,0 +1,99 @@
+import argparse
+import threading
+import time
+import numpy as np
+import corpus
+import encoder
+import store
+
+# neighbours kept per item and target category
+NEIGHBOURS = 20
+# source rows scored against a target sheet at a time
+BLOCK_ROWS = 1024
+
+# neighbour graphs keyed by city
+_graphs = {}
+_lock = threading.Lock()
+
+
+def _sheet(settings, city):
+    return corpus.get_sheet(settings['filepath'], settings['sheet'][city], settings['module'].build_sheet)
+
+
+# top-k rows of target for every row of source as CSR arrays: row i's neighbours are
+# indices[indptr[i]:indptr[i + 1]], best first, with their cosine scores
+def neighbours(source, target, k=NEIGHBOURS, same=False):
+    k = min(k, len(target) - (1 if same else 0))
+    if k <= 0:
+        return np.zeros(len(source) + 1, dtype=np.int32), np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+    indices = np.empty((len(source), k), dtype=np.int32)
+    scores = np.empty((len(source), k), dtype=np.float32)
+    for start in range(0, len(source), BLOCK_ROWS):
+        block = source[start:start + BLOCK_ROWS] @ target.T
+        if same:
+            # an item is not its own neighbour
+            block[np.arange(len(block)), np.arange(start, start + len(block))] = -np.inf
+        top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(block, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        indices[start:start + len(block)] = np.take_along_axis(top, order, axis=1)
+        scores[start:start + len(block)] = np.take_along_axis(top_scores, order, axis=1)
+    indptr = np.arange(0, len(source) * k + 1, k, dtype=np.int32)
+    return indptr, indices.ravel(), scores.ravel()
+
+
+# one city's graph: for each (category, target category) pair the CSR neighbours,
+# plus the texts digest of each sheet so a graph built from older sheets is not served
+def build_graph(config, city, k=NEIGHBOURS):
+    sheets = {category: _sheet(settings, city) for category, settings in config.items() if city in settings['sheet']}
+    graph = {'digests': {category: store.texts_digest(sheet['df']['search_text']) for category, sheet in sheets.items()}}
+    for category, sheet in sheets.items():
+        for target, target_sheet in sheets.items():
+            graph[(category, target)] = neighbours(sheet['embeddings'], target_sheet['embeddings'], k, category == target)
+    return graph
+
+
+def _current(config, city, graph):
+    return all(store.texts_digest(_sheet(settings, city)['df']['search_text']) == graph['digests'].get(category)
+               for category, settings in config.items() if city in settings['sheet'])
+
+
+# the stored graph of a city when it matches the served sheets, built here otherwise;
+# either way it is kept in memory afterwards
+def get_graph(config, city):
+    with _lock:
+        if city not in _graphs:
+            graph = store.read_graph(city, encoder.model_id())
+            _graphs[city] = graph if graph is not None and _current(config, city, graph) else build_graph(config, city)
+        return _graphs[city]
+
+
+# suggestions from the target category most like the named item, or None for an unknown item;
+# one dictionary lookup and one CSR slice, no encoding and no search
+def similar_items(config, city, category, name, target, limit=5):
+    settings = config[category]
+    rows = corpus.name_rows(settings['filepath'], settings['sheet'][city], _sheet(settings, city), settings['name_col'])
+    row = rows.get(name.lower().strip())
+    if row is None:
+        return None
+    indptr, indices, scores = get_graph(config, city)[(category, target)]
+    start = indptr[row]
+    end = min(indptr[row + 1], start + limit)
+    catalog = _sheet(config[target], city)['catalog']
+    return [catalog.suggestion(i, round(float(score), 2)) for i, score in zip(indices[start:end], scores[start:end])]
+
+
+if __name__ == "__main__":
+    from chatbot_server import BOT_CONFIG
+    cities = sorted(BOT_CONFIG['restaurants']['sheet'])
+    parser = argparse.ArgumentParser(description='Build the item-to-item neighbour graph of every city into the store.')
+    parser.add_argument('--cities', nargs='+', default=cities, choices=cities)
+    parser.add_argument('-k', type=int, default=NEIGHBOURS, help='neighbours kept per item and category')
+    args = parser.parse_args()
+
+    for city in args.cities:
+        start = time.perf_counter()
+        graph = build_graph(BOT_CONFIG, city, args.k)
+        store.write_graph(city, encoder.model_id(), graph)
+        edges = sum(len(value[1]) for key, value in graph.items() if key != 'digests')
+        print(f"{city:<12} {edges:>7} edges  {time.perf_counter() - start:.2f}s")
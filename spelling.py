@@ -0,0 +1,127 @@
+import re
+from collections import Counter
+import facets
+
+# edits corrected at most, and the word prefix the deletes are generated from
+MAX_EDIT = 2
+PREFIX_LENGTH = 7
+# shorter words are left alone, too many real words lie one edit apart; words shorter
+# than LONG_WORD are corrected by one edit only
+MIN_LENGTH = 4
+LONG_WORD = 6
+
+# columns whose words make up the vocabulary, whichever a sheet has
+WORD_COLUMNS = ['Restaurant Name', 'Hotel Name', 'Attraction Name', 'Category', 'State', 'Address']
+TAG_PREFIXES = ['Cuisines', 'Dietary Restrictions', 'Subcategories']
+
+# hand-kept words users type that a workbook may not spell out, so they are never "corrected"
+QUERY_WORDS = ('restaurant', 'restaurants', 'hotel', 'hotels', 'attraction', 'attractions', 'near', 'nearby',
+               'around', 'within', 'cheap', 'budget', 'luxury', 'boutique', 'best', 'good', 'food', 'places',
+               'place', 'things', 'with', 'for', 'kids', 'family', 'friendly', 'romantic', 'dinner', 'lunch',
+               'breakfast', 'brunch', 'hostel', 'homestay', 'chalet', 'resort', 'beach', 'pool', 'view', 'stay',
+               'visit', 'eat', 'open', 'late', 'night', 'nightlife', 'hiking', 'waterfall', 'mamak', 'hawker',
+               'kopitiam', 'kway', 'kuey', 'teow', 'durian', 'cendol', 'laksa', 'satay', 'halal')
+
+WORD = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+
+# the word and every string reached from it by deleting up to distance characters
+def _deletes(word, distance):
+    found = {word}
+    frontier = {word}
+    for _ in range(distance):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        found |= frontier
+    return found
+
+
+# optimal string alignment distance (insertions, deletions, substitutions and adjacent
+# transpositions); anything over limit comes back as limit + 1
+def distance(a, b, limit):
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        before, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+def _words(values):
+    return WORD.findall(' '.join(values.fillna('').astype(str).str.lower()))
+
+
+# a workbook's vocabulary as (counts, known): counts are the words queries are corrected
+# towards (names, tags, categories, states and addresses of every sheet, any extra phrases,
+# the facet aliases and QUERY_WORDS); known are the description words, left as typed but
+# never offered as corrections, since descriptions carry the data's own typos
+def vocabulary(frames, extra=()):
+    counts, known = Counter(), set()
+    for df in frames:
+        columns = [col for col in WORD_COLUMNS if col in df.columns]
+        columns += [col for prefix in TAG_PREFIXES for col in facets.tag_columns(df, prefix)]
+        for col in columns:
+            counts.update(_words(df[col]))
+        if 'Description' in df.columns:
+            known.update(_words(df['Description']))
+    for phrase in [*extra, *facets.ALIASES, *facets.ALIASES.values(), *QUERY_WORDS]:
+        counts.update(WORD.findall(phrase.lower()))
+    return counts, known
+
+
+# symmetric-delete spelling correction: every word's deletes (of its first PREFIX_LENGTH
+# characters, up to MAX_EDIT of them) map back to the word, so a query word only needs its
+# own deletes looked up to find every vocabulary word within MAX_EDIT edits
+class SpellChecker:
+    def __init__(self, counts, known=(), max_edit=MAX_EDIT, prefix_length=PREFIX_LENGTH):
+        self.counts = dict(counts)
+        self.known = set(known) | set(self.counts)
+        self.max_edit = max_edit
+        self.prefix_length = prefix_length
+        self.deletes = {}
+        for word in self.counts:
+            for key in _deletes(word[:prefix_length], max_edit):
+                self.deletes.setdefault(key, []).append(word)
+
+    def __len__(self):
+        return len(self.counts)
+
+    # a vocabulary word, or the plural of one
+    def is_known(self, word):
+        return word in self.known or (word.endswith('s') and (word[:-1] in self.known or
+                                                               (word.endswith('es') and word[:-2] in self.known)))
+
+    # the closest vocabulary word, the most frequent one among equally close words (then the
+    # first alphabetically, so ties never depend on set order);
+    # known, short and unmatched words come back unchanged
+    def lookup(self, word):
+        if len(word) < MIN_LENGTH or self.is_known(word):
+            return word
+        max_edit = self.max_edit if len(word) >= LONG_WORD else 1
+        best, best_key = word, None
+        seen = set()
+        for key in _deletes(word[:self.prefix_length], max_edit):
+            for candidate in self.deletes.get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                edits = distance(word, candidate, max_edit)
+                rank = (edits, -self.counts[candidate], candidate)
+                if edits <= max_edit and (best_key is None or rank < best_key):
+                    best, best_key = candidate, rank
+        return best
+
+    # the query with each misspelled word replaced; everything else is kept as typed
+    def correct(self, query):
+        def replace(match):
+            word = match.group(0)
+            fixed = self.lookup(word.lower())
+            return word if fixed == word.lower() else fixed
+        return re.sub(r"[A-Za-z]+(?:'[A-Za-z]+)?", replace, query)
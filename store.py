@@ -0,0 +1,243 @@
+import glob
+import hashlib
+import json
+import os
+import faiss
+import numpy as np
+import pandas as pd
+
+# TRIP_STORE points the server and the pipeline at another store directory
+STORE_ENV = 'TRIP_STORE'
+
+# store/<workbook>/<sheet>.parquet  cleaned sheet, columnar
+# store/vectors/<model>/            embeddings shared by every sheet, keyed by text content
+# store/manifest.json               input hashes of the last pipeline run
+# store/indexes/<model>/            one FAISS index file per sheet and their manifest
+# store/graphs/<model>/<city>.npz    item-to-item neighbour graph of a city
+
+# pool keys per model: model -> (mtime, key -> row)
+_pools = {}
+
+# rows copied at a time when the pool file is rewritten
+COPY_ROWS = 4096
+
+
+def root():
+    return os.environ.get(STORE_ENV, 'store')
+
+
+def _directory(filepath):
+    return os.path.join(root(), os.path.splitext(os.path.basename(filepath))[0])
+
+
+def sheet_path(filepath, sheet_name):
+    return os.path.join(_directory(filepath), sheet_name + '.parquet')
+
+
+def has_sheet(filepath, sheet_name):
+    return os.path.exists(sheet_path(filepath, sheet_name))
+
+
+def read_sheet(filepath, sheet_name):
+    path = sheet_path(filepath, sheet_name)
+    if not os.path.exists(path):
+        return None
+    # empty cells come back as NaN, as they do from read_excel
+    return pd.read_parquet(path).replace({None: np.nan})
+
+
+# one column of a stored sheet, read without the rest of it; None when the sheet is not stored
+def read_column(filepath, sheet_name, column):
+    path = sheet_path(filepath, sheet_name)
+    if not os.path.exists(path):
+        return None
+    return pd.read_parquet(path, columns=[column])[column]
+
+
+# every stored sheet of a workbook, keyed by sheet name
+def read_sheets(filepath):
+    paths = sorted(glob.glob(os.path.join(_directory(filepath), '*.parquet')))
+    return {os.path.splitext(os.path.basename(path))[0]: pd.read_parquet(path).replace({None: np.nan}) for path in paths}
+
+
+# write to a temporary file first so readers never see half a file
+def _replace(path, write):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + '.tmp'
+    write(temporary)
+    os.replace(temporary, path)
+
+
+def write_sheet(filepath, sheet_name, df):
+    # parquet needs one type per column: mixed object columns become strings, gaps stay null
+    df = df.copy()
+    for col in df.select_dtypes(include='object'):
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+    _replace(sheet_path(filepath, sheet_name), lambda path: df.to_parquet(path, index=False))
+
+
+# likes change while serving; only that column is rewritten
+def write_likes(filepath, sheet_name, likes):
+    df = pd.read_parquet(sheet_path(filepath, sheet_name))
+    df['Number of Likes'] = np.asarray(likes, dtype='int64')
+    _replace(sheet_path(filepath, sheet_name), lambda path: df.to_parquet(path, index=False))
+
+
+def _pool_directory(model_name):
+    return os.path.join(root(), 'vectors', model_name.replace('/', '_'))
+
+
+def normalise_text(text):
+    return ' '.join(str(text).lower().split())
+
+
+# identical text encoded by the same model always maps to the same key
+def content_key(text, model_name):
+    return hashlib.blake2b(f'{model_name}\x00{normalise_text(text)}'.encode('utf-8'), digest_size=16).hexdigest()
+
+
+# keys.txt lists one key per row of vectors.npy; vectors are written first,
+# so a reader never sees a key without its row
+def _pool_keys(model_name):
+    keys_path = os.path.join(_pool_directory(model_name), 'keys.txt')
+    if not os.path.exists(keys_path):
+        return {}
+    mtime = os.path.getmtime(keys_path)
+    cached = _pools.get(model_name)
+    if cached is None or cached[0] != mtime:
+        with open(keys_path, encoding='ascii') as f:
+            keys = f.read().split()
+        cached = _pools[model_name] = (mtime, {key: row for row, key in enumerate(keys)})
+    return cached[1]
+
+
+# keys of texts that have no vector yet, each listed once
+def missing_keys(keys, model_name):
+    rows = _pool_keys(model_name)
+    return [key for key in dict.fromkeys(keys) if key not in rows]
+
+
+# vectors for texts in row order, or None if any text was never encoded;
+# only the requested rows are read from the memory-mapped pool
+def lookup_vectors(texts, model_name):
+    rows = _pool_keys(model_name)
+    try:
+        ids = [rows[content_key(text, model_name)] for text in texts]
+    except KeyError:
+        return None
+    pool = np.load(os.path.join(_pool_directory(model_name), 'vectors.npy'), mmap_mode='r')
+    return np.ascontiguousarray(pool[ids], dtype='float32')
+
+
+# append vectors for new keys as chunks arrive, in key order; the old pool is
+# copied across through a memmap, so memory holds one chunk at a time
+def append_vectors(model_name, keys, chunks, dimension):
+    rows = _pool_keys(model_name)
+    directory = _pool_directory(model_name)
+    vectors_path = os.path.join(directory, 'vectors.npy')
+    os.makedirs(directory, exist_ok=True)
+
+    temporary = vectors_path + '.tmp'
+    out = np.lib.format.open_memmap(temporary, mode='w+', dtype='float32', shape=(len(rows) + len(keys), dimension))
+    if rows:
+        old = np.load(vectors_path, mmap_mode='r')
+        for start in range(0, len(rows), COPY_ROWS):
+            end = min(start + COPY_ROWS, len(rows))
+            out[start:end] = old[start:end]
+        del old
+    position = len(rows)
+    for chunk in chunks:
+        out[position:position + len(chunk)] = chunk
+        position += len(chunk)
+    if position != len(out):
+        raise ValueError(f'expected {len(out) - len(rows)} vectors, got {position - len(rows)}')
+    out.flush()
+    del out
+    os.replace(temporary, vectors_path)
+
+    def write_keys(path):
+        with open(path, 'w', encoding='ascii') as f:
+            f.write('\n'.join(sorted(rows, key=rows.get) + list(keys)))
+    _replace(os.path.join(directory, 'keys.txt'), write_keys)
+    return len(keys)
+
+
+# identifies the exact texts an index was built from, in row order
+def texts_digest(texts):
+    digest = hashlib.blake2b(digest_size=16)
+    for text in texts:
+        digest.update(str(text).encode('utf-8') + b'\x00')
+    return digest.hexdigest()
+
+
+def _index_directory(model_name):
+    return os.path.join(root(), 'indexes', model_name.replace('/', '_'))
+
+
+# manifest key of a sheet's index, e.g. final_hotels/Hotels_KL
+def index_key(filepath, sheet_name):
+    return os.path.splitext(os.path.basename(filepath))[0] + '/' + sheet_name
+
+
+def index_path(filepath, sheet_name, model_name):
+    return os.path.join(_index_directory(model_name), index_key(filepath, sheet_name) + '.faiss')
+
+
+def write_index(filepath, sheet_name, model_name, index):
+    _replace(index_path(filepath, sheet_name, model_name), lambda path: faiss.write_index(index, path))
+
+
+def read_index(filepath, sheet_name, model_name):
+    path = index_path(filepath, sheet_name, model_name)
+    return faiss.read_index(path) if os.path.exists(path) else None
+
+
+def graph_path(city, model_name):
+    return os.path.join(root(), 'graphs', model_name.replace('/', '_'), city + '.npz')
+
+
+# graph arrays flattened into one .npz: "<category>/<target>/<indptr|indices|scores>" and "digest/<category>"
+def write_graph(city, model_name, graph):
+    arrays = {f'digest/{category}': np.array(digest) for category, digest in graph['digests'].items()}
+    for key, csr in graph.items():
+        if key != 'digests':
+            arrays.update({f'{key[0]}/{key[1]}/{part}': array for part, array in zip(('indptr', 'indices', 'scores'), csr)})
+
+    def write(path):
+        with open(path, 'wb') as f:
+            np.savez(f, **arrays)
+    _replace(graph_path(city, model_name), write)
+
+
+def read_graph(city, model_name):
+    path = graph_path(city, model_name)
+    if not os.path.exists(path):
+        return None
+    graph = {'digests': {}}
+    with np.load(path) as arrays:
+        for name in arrays.files:
+            parts = name.split('/')
+            if parts[0] == 'digest':
+                graph['digests'][parts[1]] = str(arrays[name])
+            elif parts[2] == 'indptr':
+                graph[(parts[0], parts[1])] = tuple(arrays[f'{parts[0]}/{parts[1]}/{part}'] for part in ('indptr', 'indices', 'scores'))
+    return graph
+
+
+def index_manifest_path(model_name):
+    return os.path.join(_index_directory(model_name), 'manifest.json')
+
+
+def read_manifest(path=None):
+    path = path or os.path.join(root(), 'manifest.json')
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write_manifest(manifest, path=None):
+    def write(temporary):
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+    _replace(path or os.path.join(root(), 'manifest.json'), write)
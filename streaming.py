@@ -0,0 +1,64 @@
+import difflib
+import numpy as np
+import corpus
+import metrics
+import responses
+import sessions
+
+# name hits sent in the first stage
+NAME_HITS = 3
+# queries shorter than this are not matched inside names; "hi" is in too many of them
+MIN_SUBSTRING = 3
+# SequenceMatcher ratio a name needs to count as a fuzzy hit
+FUZZY_CUTOFF = 0.6
+
+NDJSON = 'application/x-ndjson'
+
+
+# rows whose names match the query: exact matches, then names containing it, then close
+# spellings of it, first occurrence of each name only
+@metrics.timed('name_hits')
+def name_hits(names, query, limit=NAME_HITS):
+    query = ' '.join(query.lower().split())
+    if not query:
+        return []
+    found = list(np.flatnonzero(names == query))
+    if len(query) >= MIN_SUBSTRING:
+        found += [row for row, name in enumerate(names) if query in name]
+    found += [int(np.flatnonzero(names == name)[0])
+              for name in difflib.get_close_matches(query, names, limit, FUZZY_CUTOFF)]
+    return list(dict.fromkeys(int(row) for row in found))[:limit]
+
+
+# the first stage, answered before the sheet is built: full suggestions when it is in memory,
+# just the names otherwise
+def name_stage(settings, sheet_name, query, limit=NAME_HITS):
+    names = corpus.sheet_names(settings['filepath'], sheet_name, settings['name_col'])
+    rows = name_hits(names, query, limit)
+    sheet = corpus.built_sheet(settings['filepath'], sheet_name)
+    if sheet is not None:
+        return {"suggestions": [sheet['catalog'].suggestion(row, None) for row in rows]}
+    return {"suggestions": [{"name": names[row].title()} for row in rows]}
+
+
+def line(stage, payload):
+    return responses.encode(dict(payload, stage=stage)) + b'\n'
+
+
+# one /chat request as NDJSON lines, each sent as soon as its stage completes: name hits
+# ("names"), the retrieved page ("retrieved"), then the scored and personalised page
+# ("ranked") carrying everything a plain /chat response does. The session is saved once the
+# ranked page has set its cursor
+def chat_lines(settings, city, sheet_name, query, liked, session_id, session, preference):
+    try:
+        yield line('names', name_stage(settings, sheet_name, query))
+        stages = settings['module'].request_stages(city=city, query=query, liked=liked, sheet_name=sheet_name,
+                                                   filepath=settings['filepath'], name_col=settings['name_col'],
+                                                   session=session, preference=preference)
+        for stage, payload in stages:
+            if stage == 'ranked':
+                sessions.save(session_id, session)
+                payload["session_id"] = session_id
+            yield line(stage, payload)
+    except Exception as e:
+        yield line('ranked', {"error": f"Server error: {str(e)}"})
@@ -11,6 +11,10 @@ function CategoryChatPage() {
   const [chatHistory, setChatHistory] = useState([]);
   const [allSuggestions, setAllSuggestions] = useState([]);
   const [loading, setLoading] = useState(false);
+  // the server keeps this session's likes and last results
+  const [sessionId, setSessionId] = useState(null);
+  // names and tags completing what is being typed
+  const [completions, setCompletions] = useState([]);
 
   // Initialize with a welcome message when component mounts
   useEffect(() => {
@@ -22,6 +26,21 @@ function CategoryChatPage() {
     ]);
   }, [city, category]);
 
+  // fetch completions on each keystroke; a newer keystroke cancels the older request
+  useEffect(() => {
+    if (query.trim().length < 2) {
+      setCompletions([]);
+      return;
+    }
+    const controller = new AbortController();
+    const params = new URLSearchParams({ city, category, prefix: query });
+    fetch(`http://localhost:5000/suggest?${params}`, { signal: controller.signal })
+      .then((res) => res.json())
+      .then((data) => setCompletions(data.suggestions || []))
+      .catch(() => {});
+    return () => controller.abort();
+  }, [query, city, category]);
+
   const handleQuery = async (e) => {
     e?.preventDefault();
     
@@ -30,6 +49,58 @@ function CategoryChatPage() {
     setChatHistory((prev) => [...prev, { sender: 'user', text: query }]);
     setLoading(true);
 
+    // one bot message per query, filled in as each NDJSON stage arrives: name hits first,
+    // then the retrieved page, then the ranked page that replaces them
+    const messageId = Date.now();
+    const showStage = (message) => {
+      setChatHistory((prev) =>
+        prev.some((entry) => entry.id === messageId)
+          ? prev.map((entry) => (entry.id === messageId ? { ...message, id: messageId } : entry))
+          : [...prev, { ...message, id: messageId }]
+      );
+    };
+
+    const showResponse = (data) => {
+      if (data.session_id) setSessionId(data.session_id);
+
+      if (data.suggestions && data.suggestions.length > 0) {
+        setAllSuggestions(data.suggestions);
+
+        showStage({
+          sender: 'bot',
+          text: data.corrected_query
+            ? `Showing results for "${data.corrected_query}". Here are some ${category} in ${city}:`
+            : `Here are some ${category} in ${city}:`,
+          suggestions: data.suggestions,
+          hasMore: Boolean(data.next_cursor),
+          cursor: data.next_cursor,
+          shownCount: data.suggestions.length,
+          totalCount: data.total_results,
+          originalQuery: query
+        });
+      } else if (data.response) {
+        showStage({ sender: 'bot', text: data.response });
+      } else if (data.error) {
+        showStage({ sender: 'bot', text: `Error: ${data.error}` });
+      } else {
+        showStage({
+          sender: 'bot',
+          text: "I couldn't find anything matching your query. Try asking differently."
+        });
+      }
+    };
+
+    const showEarlyStage = (data) => {
+      if (!data.suggestions || data.suggestions.length === 0) return;
+      showStage({
+        sender: 'bot',
+        text: data.stage === 'names'
+          ? `Names matching "${query}" (still searching...):`
+          : `Here are some ${category} in ${city} (ranking...):`,
+        suggestions: data.suggestions
+      });
+    };
+
     try {
       const res = await fetch(`http://localhost:5000/chat`, {
         method: 'POST',
@@ -38,36 +109,33 @@ function CategoryChatPage() {
           city, 
           category, 
           query,
-          liked: Object.keys(likedItems).filter(item => likedItems[item])
+          session_id: sessionId,
+          stream: true
         }),
       });
 
-      const data = await res.json();
-      
-      if (data.suggestions && data.suggestions.length > 0) {
-        setAllSuggestions(data.suggestions);
-        
-        setChatHistory((prev) => [
-          ...prev,
-          {
-            sender: 'bot',
-            text: `Here are some ${category} in ${city}:`,
-            suggestions: data.suggestions,
-            hasMore: data.total_results > data.suggestions.length,
-            shownCount: data.suggestions.length,
-            totalCount: data.total_results,
-            originalQuery: query
-          },
-        ]);
-      } else if (data.response) {
-        setChatHistory((prev) => [...prev, { sender: 'bot', text: data.response }]);
-      } else if (data.error) {
-        setChatHistory((prev) => [...prev, { sender: 'bot', text: `Error: ${data.error}` }]);
+      if (!res.ok || !res.body) {
+        showResponse(await res.json());
       } else {
-        setChatHistory((prev) => [...prev, { 
-          sender: 'bot', 
-          text: "I couldn't find anything matching your query. Try asking differently." 
-        }]);
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        for (;;) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffered += decoder.decode(value, { stream: true });
+          const lines = buffered.split('\n');
+          buffered = lines.pop();
+          for (const line of lines) {
+            if (!line.trim()) continue;
+            const data = JSON.parse(line);
+            if (data.stage === 'ranked') {
+              showResponse(data);
+            } else {
+              showEarlyStage(data);
+            }
+          }
+        }
       }
     } catch (error) {
       console.error("API request failed:", error);
@@ -96,8 +164,9 @@ function CategoryChatPage() {
           city, 
           category, 
           query: message.originalQuery,
-          offset: message.shownCount,
-          limit: 2
+          cursor: message.cursor,
+          limit: 2,
+          session_id: sessionId
         }),
       });
 
@@ -108,7 +177,8 @@ function CategoryChatPage() {
           ...message,
           suggestions: [...message.suggestions, ...data.suggestions],
           shownCount: message.shownCount + data.suggestions.length,
-          hasMore: message.shownCount + data.suggestions.length < data.total_results
+          hasMore: Boolean(data.next_cursor),
+          cursor: data.next_cursor
         };
 
         setChatHistory(prev => [
@@ -133,7 +203,7 @@ function CategoryChatPage() {
       await fetch('http://localhost:5000/like', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ city, category, name: itemName }),
+        body: JSON.stringify({ city, category, name: itemName, session_id: sessionId }),
       });
 
       setLikedItems((prev) => ({ ...prev, [itemName]: true }));
@@ -153,6 +223,20 @@ function CategoryChatPage() {
           return entry;
         })
       );
+
+      // follow a like with items like it, read from the server's neighbour graph
+      const similarRes = await fetch('http://localhost:5000/similar', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ city, category, name: itemName, limit: 3 }),
+      });
+      const similar = await similarRes.json();
+      if (similar.suggestions && similar.suggestions.length > 0) {
+        setChatHistory((prev) => [
+          ...prev,
+          { sender: 'bot', text: `Since you liked ${itemName}, you might also like:`, suggestions: similar.suggestions },
+        ]);
+      }
     } catch (error) {
       console.error("Failed to like item:", error);
     }
@@ -218,9 +302,9 @@ function CategoryChatPage() {
                     entry.suggestions.map((item, subIdx) => (
                       <div key={subIdx} className="chat-suggestion">
                         <h3 className="chat-suggestion-title">{item.name}</h3>
-                        <p>{item.description}</p>
-                        <p>📍 {item.address}</p>
-                        {item.reviews?.startsWith('http') ? (
+                        {item.description && <p>{item.description}</p>}
+                        {item.address && <p>📍 {item.address}</p>}
+                        {item.reviews === undefined ? null : item.reviews?.startsWith('http') ? (
                           <p>
                             ⭐ Reviews:{' '}
                             <a href={item.reviews} target="_blank" rel="noopener noreferrer">
@@ -238,7 +322,7 @@ function CategoryChatPage() {
                             </a>
                           </p>
                         )}
-                        {item.relevance !== undefined && (
+                        {item.relevance != null && (
                           <p className="relevance-score">🔍 Relevance Score: {item.relevance.toFixed(2)}</p>
                         )}
                         <div className="like-buttons">
@@ -281,7 +365,13 @@ function CategoryChatPage() {
                 onChange={(e) => setQuery(e.target.value)}
                 placeholder="Ask me something..."
                 className="chat-input"
+                list="chat-completions"
               />
+              <datalist id="chat-completions">
+                {completions.map((item) => (
+                  <option key={`${item.type}:${item.text}`} value={item.text} />
+                ))}
+              </datalist>
               <button type="submit" className="chat-button">
                 Ask
               </button>
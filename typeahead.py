@@ -0,0 +1,89 @@
+import bisect
+import re
+import threading
+import numpy as np
+import corpus
+
+# completions returned per keystroke
+LIMIT = 8
+# shorter prefixes complete nothing; a single letter matches most of a sheet
+MIN_PREFIX = 2
+
+WORD_START = re.compile(r'(?<![\w\'])\w')
+
+# prefix indexes keyed by (filepath, sheet_name)
+_indexes = {}
+_lock = threading.Lock()
+
+
+def normalise(text):
+    return ' '.join(str(text).lower().split())
+
+
+# every key a phrase completes from: the phrase itself and its tail from each later word,
+# so "cenang" completes "Mercure Langkawi Pantai Cenang"
+def _tails(phrase):
+    return [phrase[m.start():] for m in WORD_START.finditer(phrase)]
+
+
+# names and facet tags of one sheet as one sorted array of keys; a prefix is the key range
+# found by two binary searches. Each key refers to a row (>= 0) or a tag (-1 - tag number),
+# and completions rank by the likes of the row, or of all the tag's rows, read at query time
+class PrefixIndex:
+    def __init__(self, names, tags):
+        entries = []
+        for row, name in enumerate(names):
+            entries.extend((key, row) for key in _tails(normalise(name)))
+        self.tags = list(tags.items())
+        for number, ((_, tag), _) in enumerate(self.tags):
+            entries.extend((key, -1 - number) for key in _tails(normalise(tag)))
+        entries.sort()
+        self.keys = [key for key, _ in entries]
+        self.refs = np.array([ref for _, ref in entries], dtype=np.int32)
+        self.names = list(names)
+
+    def __len__(self):
+        return len(self.keys)
+
+    # up to limit completions of prefix as (text, field, likes): names rank by the row's
+    # likes, tags by the likes of their rows, and ties go to names, then alphabetically
+    def complete(self, prefix, likes, limit=LIMIT):
+        prefix = normalise(prefix)
+        if len(prefix) < MIN_PREFIX:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        end = bisect.bisect_left(self.keys, prefix + '\uffff', start)
+        refs = np.unique(self.refs[start:end])
+        rows, tags = refs[refs >= 0], -1 - refs[refs < 0]
+        # only the best-liked rows can make the list, however many names match
+        rows = rows[corpus.top_k(likes[rows], limit)]
+        found = [(self.names[row], 'name', int(likes[row])) for row in rows]
+        for number in tags:
+            (field, tag), ids = self.tags[number]
+            found.append((tag, field, int(likes[ids].sum())))
+        found.sort(key=lambda item: (-item[2], item[1] != 'name', item[0].lower()))
+        return found[:limit]
+
+
+# the facet tags found in one sheet: (field, tag) -> its row ids there
+def sheet_tags(facet_index, sheet_name):
+    return {(field, tag): entry['rows'][sheet_name]
+            for field, field_tags in facet_index['tags'].items()
+            for tag, entry in field_tags.items() if len(entry['rows'].get(sheet_name, ()))}
+
+
+def get_index(filepath, sheet_name, sheet):
+    key = (filepath, sheet_name)
+    with _lock:
+        if key not in _indexes:
+            _indexes[key] = PrefixIndex(sheet['catalog'].column('name'), sheet_tags(sheet['facets'], sheet_name))
+        return _indexes[key]
+
+
+# completions of what a user has typed so far in one city and category
+def suggest(config, city, category, prefix, limit=LIMIT):
+    settings = config[category]
+    sheet_name = settings['sheet'][city]
+    sheet = corpus.get_sheet(settings['filepath'], sheet_name, settings['module'].build_sheet)
+    completions = get_index(settings['filepath'], sheet_name, sheet).complete(prefix, sheet['catalog'].likes, limit)
+    return [{'text': text, 'type': field, 'likes': likes} for text, field, likes in completions]